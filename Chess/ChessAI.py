@@ -1,80 +1,100 @@
+import multiprocessing
+import os
+import pickle
 import random
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
-# global nextMove
-
-# King score doesn't matter, because you can't technically capture the King
-pieceScores = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
-
-knightScores = [
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 2, 2, 2, 2, 2, 2, 1],
-    [1, 2, 3, 3, 3, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 3, 3, 3, 2, 1],
-    [1, 2, 2, 2, 2, 2, 2, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1]
-]
-
-bishopScores = [
-    [4, 3, 2, 1, 1, 2, 3, 4],
-    [3, 4, 3, 2, 2, 3, 4, 3],
-    [2, 3, 4, 3, 3, 4, 3, 2],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [2, 3, 4, 3, 3, 4, 3, 1],
-    [3, 4, 3, 2, 2, 3, 4, 1],
-    [4, 3, 2, 1, 1, 2, 3, 1]
-]
-
-queenScores = [
-    [1, 1, 1, 3, 1, 1, 1, 1],
-    [1, 2, 3, 3, 3, 1, 1, 1],
-    [1, 4, 3, 3, 3, 4, 2, 1],
-    [1, 2, 3, 3, 3, 2, 2, 1],
-    [1, 2, 3, 3, 3, 2, 2, 1],
-    [1, 4, 3, 3, 3, 4, 2, 1],
-    [1, 2, 3, 3, 3, 1, 1, 1],
-    [1, 1, 1, 3, 1, 1, 1, 1]
-]
-
-rookScores = [
-    [4, 3, 4, 4, 4, 4, 3, 4],
-    [4, 4, 4, 4, 4, 4, 4, 4],
-    [1, 1, 2, 3, 3, 2, 1, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 1, 2, 3, 3, 2, 1, 1],
-    [4, 4, 4, 4, 4, 4, 4, 4],
-    [4, 3, 4, 4, 4, 4, 3, 4]
-]
-
-whitePawnScores = [
-    [9, 9, 9, 9, 9, 9, 9, 9],
-    [8, 8, 8, 8, 8, 8, 8, 8],
-    [5, 6, 6, 7, 7, 6, 6, 5],
-    [2, 3, 3, 5, 5, 3, 3, 2],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 1, 1, 0, 0, 1, 1, 1],
-    [0, 0, 0, 0, 0, 0, 0, 0]
-]
-
-blackPawnScores = [
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [1, 1, 1, 0, 0, 1, 1, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [2, 3, 3, 5, 5, 3, 3, 2],
-    [5, 6, 6, 7, 7, 6, 6, 5],
-    [8, 8, 8, 8, 8, 8, 8, 8],
-    [9, 9, 9, 9, 9, 9, 9, 9]
-]
-
-piecePositionScores = {"N": knightScores, "B": bishopScores, "Q": queenScores,
-                      "R": rookScores, "bP": blackPawnScores, "wP": whitePawnScores}
+from Chess import ChessEngine
+from Chess.bitbase import Bitbases
+from Chess.book import OpeningBook
+from Chess.evaluation import (pieceScores, knightScores, bishopScores, queenScores, rookScores, whitePawnScores,
+                              blackPawnScores, piecePositionScores)
 
 CHECKMATE = 1000 # Worth the most since it wins the game
 STALEMATE = 0 # Always better than a losing position
-DEPTH = 4
+DRAW = 0 # Repetition, fifty move rule or not enough material to mate
+DEPTH = 3 # Search depth when findBestMove isn't given a time limit
+MAX_DEPTH = 32 # Deepest iteration a timed search will start
+TIME_CHECK_NODES = 64 # How often (in nodes) the search looks at the clock
+TT_SIZE_MB = 16 # Memory the transposition table may use
+WORKERS = 1 # Processes a Searcher splits the root moves across, 1 searches in this process
+BOOK_FILE = "book.bin" # Opening book (Chess.book) the GUI's AI plays from, if the file exists
+BITBASE_DIR = "bitbases" # KQK/KRK/KPK bitbases (Chess.bitbase) the GUI's AI probes, if the directory exists
+KNOWN_WIN = 500 # Base score of a position the bitbases say is won, mates still score more
+
+# Transposition table bound types
+EXACT = 0 # Score is the true value of the position
+LOWER_BOUND = 1 # Search failed high, true value is at least the score
+UPPER_BOUND = 2 # Search failed low, true value is at most the score
+
+
+'''
+Fixed size hash table of search results, keyed by GameState.zobristKey
+Each slot holds (key, depth, score, bound, bestMoveID, age), the table never grows past its slot count
+'''
+class TranspositionTable:
+    ENTRY_SIZE = 160 # Rough bytes per filled slot (entry tuple, key, score, list pointer), to turn MB into slots
+
+    def __init__(self, sizeMB=TT_SIZE_MB):
+        slots = max(1, int(sizeMB * 1024 * 1024) // self.ENTRY_SIZE)
+        self.size = 1 << (slots.bit_length() - 1) # Round down to a power of 2 so the index is a mask
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.age = 0
+
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    '''
+    Replacement policy: same position or deeper search always wins, otherwise only overwrite entries left over
+    from an earlier search so deep results from this search aren't pushed out by shallow ones
+    '''
+    def store(self, key, depth, score, bound, bestMoveID):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[0] == key or depth >= entry[1] or entry[5] != self.age:
+            self.entries[index] = (key, depth, score, bound, bestMoveID, self.age)
+
+    def newSearch(self):
+        self.age += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.age = 0
+
+
+# Move ordering scores
+MAX_PLY = 64
+PV_MOVE_SCORE = 2000000
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+KILLER_SCORES = (90000, 80000)
+HISTORY_LIMIT = 50000 # Keeps history below the killer band
+
+# Quiescence search
+DELTA_MARGIN = 2 # A capture that can't lift the score to within this much of alpha isn't searched
+
+# Principal variation search
+NULL_WINDOW = 0.01 # Width of the window moves after the first are tried with, scores move in steps of .1
+ASPIRATION_WINDOW = 0.5 # Each iteration's root window is the last score plus or minus this
+
+# Selective search, scores in pawns like scoreBoard. Margins are indexed by remaining depth
+NULL_MOVE_REDUCTION = 2 # A null move is searched this much shallower than a real one
+# Shallowest node that tries a null move: its search keeps at least one full ply, a null search that went
+# straight to quiescence would cost more than the cutoffs it finds
+NULL_MOVE_MIN_DEPTH = NULL_MOVE_REDUCTION + 2
+LMR_FULL_MOVES = 3 # Moves searched at full depth before late quiet moves get reduced
+LMR_MIN_DEPTH = 3
+LMR_REDUCTION = 1
+FUTILITY_MARGINS = (0, 1.5, 5) # Quiet moves are skipped if the static score plus this can't reach alpha
+RAZOR_MARGINS = (0, 3, 5) # Nodes this far below alpha are tried with a quiescence search first
+
 
 def findRandomMove(validMoves):
     return validMoves[random.randint(0, len(validMoves) - 1)]
@@ -102,7 +122,7 @@ def findBestMoveMinMaxNoRecursion(gameState, validMoves):
                 elif gameState.stalemate:
                     score = STALEMATE
                 else:
-                    score = -turnMultiplier * scoreMaterial(gameState.board) # Will be really good for black if negative
+                    score = -turnMultiplier * scoreMaterial(gameState) # Will be really good for black if negative
                 if score > opponentsMaxScore:
                     opponentsMaxScore = score
                 gameState.undoMove()
@@ -112,98 +132,605 @@ def findBestMoveMinMaxNoRecursion(gameState, validMoves):
         gameState.undoMove()
     return bestPlayerMove
 
+
+class SearchTimeout(Exception):
+    pass
+
+
 '''
-Will call the initial recursive call to this value and then return
+One search engine instance. Everything a search reads or writes lives on the object (config, node counts,
+transposition table, killers/history, principal variation, best root move), so separate Searchers can run
+at the same time in different threads or processes
 '''
-def findBestMove(gameState, validMoves):
-    global nextMove, counter
-    nextMove = None # Pick Random move
-    random.shuffle(validMoves)
-    counter = 0
-    # findMoveMinMax(gameState, validMoves, DEPTH, gameState.whiteToMove)
-    # findMoveNegaMax(gameState, validMoves, DEPTH, 1 if gameState.whiteToMove else -1)
-    findMoveNegaMaxAlphaBeta(gameState, validMoves, DEPTH, -CHECKMATE, CHECKMATE,  1 if gameState.whiteToMove else -1)
-    print(counter)
-    return nextMove
-
+class Searcher:
+    def __init__(self, depth=DEPTH, maxDepth=MAX_DEPTH, ttSizeMB=TT_SIZE_MB, workers=WORKERS, pvs=True,
+                 aspiration=True, nullMove=True, lmr=True, futility=True, razoring=True, bookFile=None,
+                 bitbaseDir=None):
+        # Config, the pool processes build their own Searchers from this so they search the same way
+        self.config = dict(depth=depth, maxDepth=maxDepth, ttSizeMB=ttSizeMB, workers=1, pvs=pvs,
+                           aspiration=aspiration, nullMove=nullMove, lmr=lmr, futility=futility, razoring=razoring,
+                           bookFile=bookFile, bitbaseDir=bitbaseDir)
+        self.depth = depth # Depth for searches without a time limit
+        self.maxDepth = maxDepth # Deepest iteration a timed search will start
+        self.workers = workers
+        self.pvs = pvs # Null window searches for every move after the first
+        self.aspiration = aspiration # Narrow root window around the previous iteration's score
+        # Selective search, each can be switched off on its own to measure what it saves and costs
+        self.nullMove = nullMove # Pass the turn, if a reduced search still beats beta the node is cut
+        self.lmr = lmr # Late move reductions: late quiet moves are searched a ply shallower unless they beat alpha
+        self.futility = futility # Skip quiet moves one or two plies from the leaves when far below alpha
+        self.razoring = razoring # Cut nodes near the leaves when far below alpha and the captures don't help
+        self.pool = None # Process pool for workers > 1, started on first use
+        self.book = OpeningBook(bookFile) if bookFile else None # Book moves are played without searching
+        self.bitbases = Bitbases(bitbaseDir) if bitbaseDir else None # Exact results for three piece endings
+        self.sharedAlpha = None # Best root score so far, read and raised by every pool process
+        # Tables, kept between searches
+        self.transpositionTable = TranspositionTable(ttSizeMB)
+        # Two quiet moves per ply that caused a beta cutoff, by moveID at [2 * ply] and [2 * ply + 1] (0 = none)
+        self.killerMoves = array('H', [0]) * (2 * MAX_PLY)
+        # Indexed by moveID: how much quiet cutoffs that move has produced anywhere in the tree
+        self.historyScores = array('i', [0]) * ChessEngine.Move.moveIDCount
+        # Principal variation: pvLines[ply] is the best line found from that ply down in the current iteration
+        self.pvLines = [[] for _ in range(MAX_PLY + 1)]
+        self.previousPV = []
+        self.followingPV = False
+        # Per search state and stats
+        self.rootDepth = depth
+        self.deadline = None
+        self.searchID = 0 # Counts searches, so the pool processes can tell when a new one starts
+        self.stopEvent = None # Event another thread or process can set to stop the search (seen by this process only)
+        self.nextMove = None # Best root move of the iteration in progress
+        self.bestMove = None # Best root move of the last completed iteration
+        self.score = 0
+        self.principalVariation = []
+        self.completedDepth = 0
+        self.nodes = 0
+        self.ttCutoffs = 0 # Nodes answered by the transposition table instead of being searched
+
+    '''
+    Iterative deepening: search depth 1, 2, 3... and keep the best move of the last iteration that finished.
+    With time_limit (seconds) it goes as deep as the budget allows, otherwise it stops at self.depth.
+    Each iteration searches the previous principal variation first.
+    A position in the opening book gets a book move straight away (completedDepth stays 0)
+    '''
+    def findBestMove(self, gameState, validMoves, time_limit=None):
+        self.nextMove = None
+        self.bestMove = None
+        self.score = 0
+        self.principalVariation = []
+        self.completedDepth = 0
+        self.nodes = 0
+        self.ttCutoffs = 0
+        if self.book is not None:
+            bookMove = self.book.getMove(gameState, validMoves)
+            if bookMove is not None:
+                self.bestMove = bookMove
+                self.principalVariation = [bookMove]
+                return bookMove
+        random.shuffle(validMoves)
+        self.searchID += 1
+        self.transpositionTable.newSearch()
+        self.resetMoveOrdering()
+        self.deadline = None if time_limit is None else time.perf_counter() + time_limit
+        maxDepth = self.depth if time_limit is None else self.maxDepth
+        movesMade = len(gameState.moveLog)
+        turnMultiplier = 1 if gameState.whiteToMove else -1
+        self.previousPV = []
+        for rootDepth in range(1, maxDepth + 1):
+            self.rootDepth = rootDepth
+            self.followingPV = True
+            self.nextMove = None
+            try:
+                if self.workers > 1 and rootDepth > 1: # Depth 1 stays here so there is always a move
+                    score = self.searchRootParallel(gameState, validMoves, rootDepth)
+                elif self.aspiration and rootDepth > 1:
+                    alpha = self.score - ASPIRATION_WINDOW
+                    beta = self.score + ASPIRATION_WINDOW
+                    score = self.negaMaxAlphaBeta(gameState, validMoves, rootDepth, alpha, beta, turnMultiplier)
+                    if score <= alpha or score >= beta: # Fell outside the window, only a bound: search it all
+                        self.nextMove = None
+                        self.followingPV = True
+                        score = self.negaMaxAlphaBeta(gameState, validMoves, rootDepth, -CHECKMATE, CHECKMATE,
+                                                      turnMultiplier)
+                else:
+                    score = self.negaMaxAlphaBeta(gameState, validMoves, rootDepth, -CHECKMATE, CHECKMATE, turnMultiplier)
+            except SearchTimeout:
+                while len(gameState.moveLog) > movesMade: # Unwind the moves the search was in the middle of
+                    gameState.undoMove()
+                if self.bestMove is None: # Out of time in the first iteration, best of the moves it got through
+                    self.bestMove = self.nextMove
+                    self.principalVariation = list(self.pvLines[0])
+                break
+            if self.nextMove is not None: # None when every move loses, keep the last real choice
+                self.bestMove = self.nextMove
+            self.score = score
+            self.principalVariation = self.previousPV = list(self.pvLines[0])
+            self.completedDepth = rootDepth
+            if abs(score) >= CHECKMATE: # Forced mate found, deeper won't change it
+                break
+        return self.bestMove
+
+    '''
+    Root split across the process pool. The first move (previous best) is searched alone to get a good alpha,
+    then the rest are farmed out; every process reads the shared alpha before it starts a move and raises it
+    when it finds something better, so later moves get searched with narrower windows
+    '''
+    def searchRootParallel(self, gameState, validMoves, depth):
+        pool = self.getPool()
+        self.sharedAlpha.value = -CHECKMATE
+        state = pickle.dumps(gameState) # Pickle once instead of once per task
+        pvMove = self.previousPV[0] if self.previousPV else None
+        rootMoves = self.orderMoves(validMoves, None, 0, pvMove)
+        # perf_counter isn't comparable between processes, wall clock is
+        deadline = None if self.deadline is None else time.time() + self.deadline - time.perf_counter()
+        results = [pool.submit(searchRootMove, state, rootMoves[0], depth, deadline, self.searchID).result()]
+        if results[0][0] is not None:
+            futures = [pool.submit(searchRootMove, state, move, depth, deadline, self.searchID)
+                       for move in rootMoves[1:]]
+            results += [future.result() for future in futures]
+
+        timedOut = False
+        bestScore = -CHECKMATE
+        bestExact = False
+        for move, (result, nodes, ttCutoffs, pv) in zip(rootMoves, results):
+            self.nodes += nodes
+            self.ttCutoffs += ttCutoffs
+            if result is None:
+                timedOut = True
+                continue
+            score, exact = result # exact is False if the score only says the move is no better than alpha
+            if score > bestScore or (score == bestScore and exact and not bestExact):
+                bestScore = score
+                bestExact = exact
+                self.nextMove = move
+                self.pvLines[0] = [move] + pv
+        if timedOut or len(results) < len(rootMoves):
+            raise SearchTimeout
+        return bestScore
+
+    def getPool(self):
+        if self.pool is None:
+            self.sharedAlpha = multiprocessing.Value('d', -CHECKMATE)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker,
+                                            initargs=(self.sharedAlpha, self.config))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.bitbases is not None:
+            self.bitbases.close()
+            self.bitbases = None
+
+    def minMax(self, gameState, validMoves, depth, whiteToMove):
+        if depth == 0:
+            return scoreMaterial(gameState)
+
+        if whiteToMove: # Maximize
+            maxScore = -CHECKMATE
+            for move in validMoves:
+                gameState.makeMove(move)
+                nextMoves = gameState.getValidMoves()
+                score = self.minMax(gameState, nextMoves, depth - 1, False)
+                if score > maxScore:
+                    maxScore = score
+                    if depth == self.rootDepth: # Worked back up the tree and are at max depth
+                        self.nextMove = move
+                gameState.undoMove()
+            return maxScore
+        else: # Minimize
+            minScore = CHECKMATE
+            for move in validMoves:
+                gameState.makeMove(move)
+                nextMoves = gameState.getValidMoves()
+                score = self.minMax(gameState, nextMoves, depth - 1, True)
+                if score < minScore:
+                    minScore = score
+                    if depth == self.rootDepth:
+                        self.nextMove = move
+                gameState.undoMove()
+            return minScore
 
-def findMoveMinMax(gameState, validMoves, depth, whiteToMove):
-    global nextMove
-    if depth == 0:
-        return scoreMaterial(gameState.board)\
+    '''
+    Cleaner way to implement MinMax alg.
+    '''
+    def negaMax(self, gameState, validMoves, depth, turnMultiplier):
+        self.nodes += 1
+        if depth == 0:
+            return turnMultiplier * scoreBoard(gameState)
 
-    if whiteToMove: # Maximize
         maxScore = -CHECKMATE
         for move in validMoves:
             gameState.makeMove(move)
             nextMoves = gameState.getValidMoves()
-            score = findMoveMinMax(gameState, nextMoves, depth - 1, False)
+            score = -self.negaMax(gameState, nextMoves, depth - 1, -turnMultiplier)
             if score > maxScore:
                 maxScore = score
-                if depth == DEPTH: # Worked back up the tree and are at max depth
-                    nextMove = move
+                if depth == self.rootDepth:
+                    self.nextMove = move
             gameState.undoMove()
         return maxScore
-    else: # Minimize
-        minScore = CHECKMATE
-        for move in validMoves:
+
+    '''
+    Alpha-Beta pruned
+    The transposition table is probed before the node's moves are generated, children are called with
+    validMoves=None and generate their own only if the table can't answer for them.
+    Principal variation search: with good ordering the first move is usually best, so the rest are only tested
+    with a null window (can it beat alpha at all?) and searched properly when the test says yes.
+    Away from the principal variation the tree is cut selectively (null move, late move reductions, futility,
+    razoring), so depth can drop by more than one per ply and ply is passed down instead of worked out from it.
+    Repeated, fifty move and dead drawn positions below the root score DRAW without being searched
+    '''
+    def negaMaxAlphaBeta(self, gameState, validMoves, depth, alpha, beta, turnMultiplier, ply=None, allowNull=True):
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_NODES == 0:
+            self.checkStop()
+        if ply is None:
+            ply = self.rootDepth - depth
+        self.pvLines[ply] = []
+        # Drawn whatever is played from here. One repetition is enough: if repeating was best once it will be again
+        if ply > 0:
+            if gameState.positionCounts.get(gameState.zobristKey, 0) > 1 or \
+                    gameState.pieceCount <= 4 and gameState.isInsufficientMaterial():
+                return DRAW
+            if gameState.halfmoveClock >= 100:
+                gameState.getValidMoves() # Mate on the hundredth halfmove still counts
+                return -CHECKMATE if gameState.checkmate else DRAW
+        # Solved endings: no need to search, the root still does so it has a move to play
+        if self.bitbases is not None and gameState.pieceCount == 3 and ply > 0:
+            result = self.bitbases.probe(gameState)
+            if result is not None:
+                return scoreBitbaseResult(gameState, result, turnMultiplier)
+        alphaOriginal = alpha
+        key = gameState.zobristKey
+        entry = self.transpositionTable.probe(key)
+        # With PVS only null window nodes take table cutoffs. Entries left by null window searches cutting a
+        # principal variation node short would make the result differ from a plain alpha-beta search
+        pvNode = self.pvs and beta - alpha > 2 * NULL_WINDOW
+        if entry is not None and entry[1] >= depth and depth != self.rootDepth and not pvNode: # Root still has to pick a move
+            score = entry[2]
+            if entry[3] == EXACT:
+                self.ttCutoffs += 1
+                return score
+            elif entry[3] == LOWER_BOUND:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if alpha >= beta:
+                self.ttCutoffs += 1
+                return score
+
+        if depth == 0:
+            score = self.quiescence(gameState, alpha, beta, turnMultiplier)
+            if score <= alphaOriginal:
+                bound = UPPER_BOUND
+            elif score >= beta:
+                bound = LOWER_BOUND
+            else:
+                bound = EXACT
+            self.transpositionTable.store(key, 0, score, bound, 0)
+            return score
+
+        inCheck = False
+        staticEval = None
+        if ply > 0 and (self.nullMove or self.lmr or self.futility or self.razoring):
+            kingRow, kingCol = gameState.whiteKingLocation if gameState.whiteToMove else gameState.blackKingLocation
+            inCheck = gameState.squareUnderAttack(kingRow, kingCol)
+            if not inCheck and not pvNode:
+                staticEval = turnMultiplier * scoreBoard(gameState)
+
+        if staticEval is not None:
+            # Razoring: far below alpha, if the captures can't win the material back either give up on the node
+            if self.razoring and depth < len(RAZOR_MARGINS) and staticEval + RAZOR_MARGINS[depth] <= alpha:
+                razorAlpha = alpha - RAZOR_MARGINS[depth]
+                score = self.quiescence(gameState, razorAlpha, razorAlpha + NULL_WINDOW, turnMultiplier)
+                if score <= razorAlpha:
+                    return score
+            # Null move: if passing still keeps the score above beta, a real move will too. Not with only
+            # King and pawns, where having to move can be what loses (zugzwang), and never two passes in a row
+            if self.nullMove and allowNull and depth >= NULL_MOVE_MIN_DEPTH and staticEval >= beta and \
+                    not self.followingPV and gameState.hasNonPawnMaterial(gameState.whiteToMove):
+                score = self.searchNullMove(gameState, depth - 1 - NULL_MOVE_REDUCTION, beta, turnMultiplier, ply)
+                if score >= beta:
+                    if score >= CHECKMATE: # A mate found after passing isn't a real one
+                        score = beta
+                    self.transpositionTable.store(key, depth, score, LOWER_BOUND, 0)
+                    return score
+
+        if validMoves is None:
+            validMoves = gameState.getValidMoves()
+        if not validMoves and not gameState.checkmate: # Stalemate, the loop below would score it as being mated
+            return STALEMATE
+        # Futility: close to the leaves a quiet move can't make up more than the margin
+        futilityScore = None
+        if self.futility and staticEval is not None and depth < len(FUTILITY_MARGINS):
+            futilityScore = staticEval + FUTILITY_MARGINS[depth]
+        reduceLate = self.lmr and ply > 0 and not inCheck and depth >= LMR_MIN_DEPTH
+        if ply < MAX_PLY:
+            killers = (self.killerMoves[2 * ply], self.killerMoves[2 * ply + 1])
+        else:
+            killers = ()
+
+        pvMove = None
+        if self.followingPV:
+            if ply < len(self.previousPV):
+                pvMove = self.previousPV[ply]
+            else:
+                self.followingPV = False
+        maxScore = -CHECKMATE
+        bestMove = None
+        for i, move in enumerate(self.orderMoves(validMoves, entry[4] if entry is not None else 0, ply, pvMove)):
+            if self.followingPV and move != pvMove: # Left the previous principal variation
+                self.followingPV = False
             gameState.makeMove(move)
-            nextMoves = gameState.getValidMoves()
-            score = findMoveMinMax(gameState, nextMoves, depth - 1, True)
-            if score < minScore:
-                minScore = score
-                if depth == DEPTH:
-                    nextMove = move
+            reduction = 0
+            if i > 0 and not move.isCapture and not move.pawnPromotion and \
+                    (futilityScore is not None and futilityScore <= alpha or
+                     reduceLate and i >= LMR_FULL_MOVES and move.moveID not in killers):
+                kingRow, kingCol = gameState.whiteKingLocation if gameState.whiteToMove else gameState.blackKingLocation
+                if not gameState.squareUnderAttack(kingRow, kingCol): # Checks are never pruned or reduced
+                    if futilityScore is not None and futilityScore <= alpha:
+                        gameState.undoMove()
+                        if futilityScore > maxScore: # The most the skipped move could be worth
+                            maxScore = futilityScore
+                        continue
+                    reduction = LMR_REDUCTION
+            if i == 0:
+                score = -self.negaMaxAlphaBeta(gameState, None, depth - 1, -beta, -alpha, -turnMultiplier, ply + 1)
+            else:
+                if reduction: # Null window at reduced depth, only a move that beats alpha gets the full search
+                    score = -self.negaMaxAlphaBeta(gameState, None, depth - 1 - reduction, -alpha - NULL_WINDOW,
+                                                   -alpha, -turnMultiplier, ply + 1)
+                if not reduction or score > alpha:
+                    if self.pvs:
+                        score = -self.negaMaxAlphaBeta(gameState, None, depth - 1, -alpha - NULL_WINDOW, -alpha,
+                                                       -turnMultiplier, ply + 1)
+                        if alpha < score < beta: # Might be better after all, get its real score
+                            score = -self.negaMaxAlphaBeta(gameState, None, depth - 1, -beta, -alpha,
+                                                           -turnMultiplier, ply + 1)
+                    else:
+                        score = -self.negaMaxAlphaBeta(gameState, None, depth - 1, -beta, -alpha, -turnMultiplier,
+                                                       ply + 1)
+            if score > maxScore:
+                maxScore = score
+                bestMove = move
+                if depth == self.rootDepth:
+                    self.nextMove = move
             gameState.undoMove()
-        return minScore
+            if maxScore > alpha: # Prune
+                alpha = maxScore
+                self.pvLines[ply] = [move] + self.pvLines[ply + 1]
+            if alpha >= beta: # Already found a better move so don't explore
+                if not move.isCapture:
+                    self.updateQuietCutoff(move, depth, ply)
+                break
+
+        if maxScore <= alphaOriginal:
+            bound = UPPER_BOUND
+        elif maxScore >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.transpositionTable.store(key, depth, maxScore, bound, bestMove.moveID if bestMove is not None else 0)
+        return maxScore
+
+    '''
+    Called every TIME_CHECK_NODES nodes: raises SearchTimeout once stopEvent is set, or once the deadline has
+    passed and there is a move to fall back on. The first iteration keeps going until one root move has a score
+    '''
+    def checkStop(self):
+        if self.stopEvent is not None and self.stopEvent.is_set():
+            raise SearchTimeout
+        if self.deadline is not None and (self.rootDepth > 1 or self.nextMove is not None) and \
+                time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+    '''
+    Null window search of the position with the turn passed, scored for the side that passed.
+    If time runs out in there the moves below the pass are taken back before the pass itself, so
+    findBestMove's unwinding of moveLog finds the board as it left it
+    '''
+    def searchNullMove(self, gameState, depth, beta, turnMultiplier, ply):
+        movesMade = len(gameState.moveLog)
+        enPassantPossible = gameState.makeNullMove()
+        try:
+            score = -self.negaMaxAlphaBeta(gameState, None, depth, -beta, -beta + NULL_WINDOW, -turnMultiplier,
+                                           ply + 1, False)
+        except SearchTimeout:
+            while len(gameState.moveLog) > movesMade:
+                gameState.undoMove()
+            gameState.undoNullMove(enPassantPossible)
+            raise
+        gameState.undoNullMove(enPassantPossible)
+        return score
+
+    '''
+    Quiescence search: past the nominal depth keep playing captures (and promotions) until the position is quiet,
+    so a leaf is never scored in the middle of an exchange. The side to move may stand pat on the static score
+    instead of capturing, unless it's in check, then every evasion is searched
+    '''
+    def quiescence(self, gameState, alpha, beta, turnMultiplier):
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_NODES == 0:
+            self.checkStop()
+        if gameState.pieceCount <= 4 and gameState.isInsufficientMaterial(): # Captured down to a dead draw
+            return DRAW
+        kingRow, kingCol = gameState.whiteKingLocation if gameState.whiteToMove else gameState.blackKingLocation
+        inCheck = gameState.squareUnderAttack(kingRow, kingCol)
+        standPat = turnMultiplier * scoreBoard(gameState)
+        if not inCheck:
+            if standPat >= beta: # Already good enough without capturing anything, skip generating moves
+                return standPat
+            alpha = max(alpha, standPat)
+        validMoves = gameState.getValidMoves() # Also sets checkmate/stalemate for scoreBoard
+        if not validMoves:
+            return turnMultiplier * scoreBoard(gameState)
+        if not inCheck:
+            validMoves = [move for move in validMoves if move.isCapture or move.pawnPromotion]
+        maxScore = -CHECKMATE if inCheck else standPat
+        for move in sorted(validMoves, key=captureOrderScore, reverse=True):
+            # Delta pruning: even winning the piece for free wouldn't get near alpha
+            if not inCheck and not move.pawnPromotion and \
+                    standPat + pieceScores[move.pieceCaptured[1]] + DELTA_MARGIN <= alpha:
+                continue
+            gameState.makeMove(move)
+            score = -self.quiescence(gameState, -beta, -alpha, -turnMultiplier)
+            gameState.undoMove()
+            if score > maxScore:
+                maxScore = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return maxScore
+
+    '''
+    Search order: previous principal variation move, hash move, captures by MVV-LVA (most valuable victim, then least
+    valuable attacker), killer moves, then quiet moves by history score. sorted() is stable, so shuffled ties stay shuffled
+    '''
+    def orderMoves(self, validMoves, hashMoveID, ply, pvMove=None):
+        if ply < MAX_PLY:
+            killer1 = self.killerMoves[2 * ply]
+            killer2 = self.killerMoves[2 * ply + 1]
+        else:
+            killer1 = killer2 = 0
+        historyScores = self.historyScores
+
+        def moveOrderScore(move):
+            moveID = move.moveID
+            if pvMove is not None and moveID == pvMove.moveID:
+                return PV_MOVE_SCORE
+            if moveID == hashMoveID:
+                return HASH_MOVE_SCORE
+            if move.isCapture or move.pawnPromotion:
+                return CAPTURE_SCORE + captureOrderScore(move)
+            if moveID == killer1:
+                return KILLER_SCORES[0]
+            if moveID == killer2:
+                return KILLER_SCORES[1]
+            return historyScores[moveID]
+
+        return sorted(validMoves, key=moveOrderScore, reverse=True)
+
+    '''
+    A quiet move caused a beta cutoff: remember it as a killer for this ply and credit its history
+    '''
+    def updateQuietCutoff(self, move, depth, ply):
+        moveID = move.moveID
+        if ply < MAX_PLY and moveID != self.killerMoves[2 * ply]:
+            self.killerMoves[2 * ply + 1] = self.killerMoves[2 * ply]
+            self.killerMoves[2 * ply] = moveID
+        score = self.historyScores[moveID] + depth * depth
+        self.historyScores[moveID] = score
+        if score > HISTORY_LIMIT:
+            self.ageHistory()
+
+    def ageHistory(self):
+        self.historyScores = array('i', [score // 2 for score in self.historyScores])
+
+    def resetMoveOrdering(self):
+        self.killerMoves = array('H', [0]) * (2 * MAX_PLY)
+        self.ageHistory() # Old history is still a hint, just a weaker one
 
 
 '''
-Cleaner way to implement MinMax alg.
+MVV-LVA: most valuable victim first, then least valuable attacker. Underpromotions rank below queening
 '''
-def findMoveNegaMax(gameState, validMoves, depth, turnMultiplier):
-    global nextMove, counter
-    counter += 1
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gameState)
-
-    maxScore = -CHECKMATE
-    for move in validMoves:
-        gameState.makeMove(move)
-        nextMoves = gameState.getValidMoves()
-        score = -findMoveNegaMax(gameState, nextMoves, depth - 1, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
-        gameState.undoMove()
-    return maxScore
+def captureOrderScore(move):
+    score = -pieceScores[move.pieceMoved[1]]
+    if move.isCapture:
+        score += 10 * pieceScores[move.pieceCaptured[1]]
+    if move.pawnPromotion:
+        score += 10 * pieceScores[move.promotionChoice]
+    return score
+
+
+# The module level functions below use one Searcher per thread, so its tables carry over between moves
+searcherLocal = threading.local()
+
+
+def getSearcher():
+    if not hasattr(searcherLocal, "searcher"):
+        searcherLocal.searcher = Searcher(bookFile=BOOK_FILE if os.path.exists(BOOK_FILE) else None,
+                                          bitbaseDir=BITBASE_DIR if os.path.isdir(BITBASE_DIR) else None)
+    return searcherLocal.searcher
+
+
+# Shared root alpha of the Searcher that started this pool process, and this process's copy of that Searcher
+workerAlpha = None
+workerSearcher = None
+
+
+def initWorker(sharedAlpha, config):
+    global workerAlpha, workerSearcher
+    workerAlpha = sharedAlpha
+    workerSearcher = Searcher(**config)
+
+
+'''
+Runs in a pool process: search one root move to depth with this process's own Searcher, set up like the parent's.
+The first task of a new search (searchID changed) ages the table and move ordering, as findBestMove does.
+Returns ((score, exact) or None if the deadline passed, nodes, ttCutoffs, principal variation after the move)
+'''
+def searchRootMove(state, move, depth, deadline, searchID):
+    gameState = pickle.loads(state)
+    searcher = workerSearcher
+    if searcher.searchID != searchID:
+        searcher.searchID = searchID
+        searcher.transpositionTable.newSearch()
+        searcher.resetMoveOrdering()
+    searcher.nodes = 0
+    searcher.ttCutoffs = 0
+    searcher.rootDepth = depth
+    searcher.deadline = None if deadline is None else time.perf_counter() + deadline - time.time()
+    searcher.previousPV = []
+    searcher.followingPV = False
+    turnMultiplier = 1 if gameState.whiteToMove else -1
+    alpha = workerAlpha.value
+    gameState.makeMove(move)
+    try:
+        score = -searcher.negaMaxAlphaBeta(gameState, None, depth - 1, -CHECKMATE, -alpha, -turnMultiplier)
+    except SearchTimeout:
+        return None, searcher.nodes, searcher.ttCutoffs, []
+    with workerAlpha.get_lock():
+        if score > workerAlpha.value:
+            workerAlpha.value = score
+    return (score, score > alpha), searcher.nodes, searcher.ttCutoffs, list(searcher.pvLines[1])
+
 
 '''
-Alpha-Beta pruned
+Will call the initial recursive call to this value and then return
 '''
+def findBestMove(gameState, validMoves, time_limit=None):
+    searcher = getSearcher()
+    bestMove = searcher.findBestMove(gameState, validMoves, time_limit=time_limit)
+    print(searcher.nodes, "nodes,", searcher.ttCutoffs, "saved by the transposition table, depth", searcher.completedDepth)
+    return bestMove
+
+
+def findMoveMinMax(gameState, validMoves, depth, whiteToMove):
+    searcher = getSearcher()
+    searcher.rootDepth = depth
+    return searcher.minMax(gameState, validMoves, depth, whiteToMove)
+
+
+def findMoveNegaMax(gameState, validMoves, depth, turnMultiplier):
+    searcher = getSearcher()
+    searcher.rootDepth = depth
+    return searcher.negaMax(gameState, validMoves, depth, turnMultiplier)
+
+
 def findMoveNegaMaxAlphaBeta(gameState, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove, counter
-    counter += 1
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gameState)
-
-    # Move Ordering - Implement Later
-    maxScore = -CHECKMATE
-    for move in validMoves:
-        gameState.makeMove(move)
-        nextMoves = gameState.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(gameState, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
-        gameState.undoMove()
-        if maxScore > alpha: # Prune
-            alpha = maxScore
-        if alpha >= beta: # Already found a better move so don't explore
-            break
-    return maxScore
+    searcher = getSearcher()
+    searcher.rootDepth = depth
+    searcher.deadline = None
+    searcher.previousPV = []
+    searcher.followingPV = False
+    return searcher.negaMaxAlphaBeta(gameState, validMoves, depth, alpha, beta, turnMultiplier)
 
 
 '''
@@ -219,41 +746,52 @@ def scoreBoard(gameState):
     elif gameState.stalemate:
         return STALEMATE
 
-    score = 0
-    for row in range(len(gameState.board)):
-        for col in range(len(gameState.board[row])):
-            square = gameState.board[row][col] # The piece
-            if square != "--":
-                # Positional Scoring
-                piecePositionScore = 0
-                if square[1] != "K": # Can do this because no position table for King
-                    if square[1] == "P": # For Pawns
-                        piecePositionScore = piecePositionScores[square][row][col]
-                    else: # Any other piece
-                        piecePositionScore = piecePositionScores[square[1]][row][col]
-
-                if square[0] == 'w':
-                    score += pieceScores[square[1]] + piecePositionScore * .1
-
-                elif square[0] == 'b':
-                    score -= pieceScores[square[1]] + piecePositionScore * .1
-
-    return score
+    # Material plus a tenth of the piece-square total, both kept up to date by GameState.makeMove/undoMove
+    return gameState.materialScore + gameState.positionScore * .1
 
 
 '''
-Score board based on material
+Score for the side to move of a position the bitbases solved (result 1 win, 0 draw, -1 loss). Every winning move
+leads to a win, so a won position also gets points for progress, otherwise the search would shuffle between won
+positions: with a Queen or Rook for boxing the lone King in with the piece's lines, pushing it to the edge and
+bringing the Kings together, with a pawn for the pawn and its King moving up the board. Material stays in so
+promoting is better still
 '''
+def scoreBitbaseResult(gameState, result, turnMultiplier):
+    if result == 0:
+        return STALEMATE
+    if result < 0: # The lone King to move, it could already be mated
+        gameState.getValidMoves()
+        if gameState.checkmate:
+            return -CHECKMATE
+    strongIsWhite = gameState.whiteToMove == (result > 0)
+    winningKing = gameState.whiteKingLocation if strongIsWhite else gameState.blackKingLocation
+    loneKing = gameState.blackKingLocation if strongIsWhite else gameState.whiteKingLocation
+    color = 'w' if strongIsWhite else 'b'
+    for row in range(8):
+        for col in range(8):
+            piece = gameState.board[row][col]
+            if piece[0] == color and piece[1] != 'K':
+                pieceRow, pieceCol = row, col
+                pieceType = piece[1]
+    score = KNOWN_WIN + pieceScores[pieceType]
+    if pieceType == 'P':
+        score += .5 * (6 - pieceRow if strongIsWhite else pieceRow - 1)
+        score += .1 * (7 - winningKing[0] if strongIsWhite else winningKing[0])
+    else:
+        # Squares left to the lone King inside the piece's rank and file
+        rows = pieceRow if loneKing[0] < pieceRow else 7 - pieceRow if loneKing[0] > pieceRow else 8
+        cols = pieceCol if loneKing[1] < pieceCol else 7 - pieceCol if loneKing[1] > pieceCol else 8
+        edgeDistance = max(3 - loneKing[0], loneKing[0] - 4) + max(3 - loneKing[1], loneKing[1] - 4) # 0 to 6
+        kingDistance = max(abs(winningKing[0] - loneKing[0]), abs(winningKing[1] - loneKing[1]))
+        score += .02 * (64 - rows * cols) + .2 * edgeDistance + .1 * (7 - kingDistance)
+    return turnMultiplier * (score if strongIsWhite else -score)
 
 
-def scoreMaterial(board):
-    score = 0
-    for row in board:
-        for square in row:
-            if square[0] == 'w':
-                score += pieceScores[square[1]]
-            elif square[0] == 'b':
-                score -= pieceScores[square[1]]
+'''
+Score board based on material
+'''
 
-    return score
 
+def scoreMaterial(gameState):
+    return gameState.materialScore
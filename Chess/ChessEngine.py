@@ -3,10 +3,56 @@
 - Responsible for finding the valid moves at a current state
 - Responsible for keeping a move log
 """
+import random
+
+from Chess.evaluation import pieceMaterialValues, pieceSquareValues
+
+# Zobrist keys: a random 64-bit number for every (piece, square), Black to move, castling rights and en passant file
+# Fixed seed so the same position hashes the same way in every process
+zobristRandom = random.Random(20210607)
+zobristPieces = {piece: [zobristRandom.getrandbits(64) for _ in range(64)]
+                 for piece in ('wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK')}
+zobristBlackToMove = zobristRandom.getrandbits(64)
+zobristCastling = [zobristRandom.getrandbits(64) for _ in range(16)] # Indexed by GameState.castlingRights
+zobristEnPassant = [zobristRandom.getrandbits(64) for _ in range(8)] # Indexed by file
+
+# Castling rights, GameState.castlingRights holds all four as bits of one int
+WHITE_KING_SIDE = 1
+WHITE_QUEEN_SIDE = 2
+BLACK_KING_SIDE = 4
+BLACK_QUEEN_SIDE = 8
+ALL_CASTLING_RIGHTS = 15
+# Rights still left after a move from or to each square: a King or Rook leaving home, or a Rook captured at home
+castlingRightsMasks = [ALL_CASTLING_RIGHTS] * 64
+castlingRightsMasks[0] &= ~BLACK_QUEEN_SIDE # a8
+castlingRightsMasks[4] &= ~(BLACK_KING_SIDE | BLACK_QUEEN_SIDE) # e8
+castlingRightsMasks[7] &= ~BLACK_KING_SIDE # h8
+castlingRightsMasks[56] &= ~WHITE_QUEEN_SIDE # a1
+castlingRightsMasks[60] &= ~(WHITE_KING_SIDE | WHITE_QUEEN_SIDE) # e1
+castlingRightsMasks[63] &= ~WHITE_KING_SIDE # h1
+
+# The undo stack keeps one fixed size record per move made: castling rights, en passant square, hash and halfmove
+# clock from before it (the captured piece is already in the Move). Record n starts at n * UNDO_RECORD_SIZE
+UNDO_RECORD_SIZE = 4
+UNDO_STACK_PLIES = 256 # Starting capacity, doubled if a game gets longer
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+castlingLetters = (('K', WHITE_KING_SIDE), ('Q', WHITE_QUEEN_SIDE), ('k', BLACK_KING_SIDE), ('q', BLACK_QUEEN_SIDE))
+# Piece each castling right needs on its home square, a FEN right without it is dropped
+castlingHomes = ((0, 0, 'bR'), (0, 4, 'bK'), (0, 7, 'bR'), (7, 0, 'wR'), (7, 4, 'wK'), (7, 7, 'wR'))
 
 
 class GameState():
-    def __init__(self):
+    '''
+    GameState(useBitboards=True) hands back the bitboard backed version (Chess.bitboards), same interface
+    '''
+    def __new__(cls, useBitboards=False):
+        if useBitboards and cls is GameState:
+            from Chess.bitboards import BitboardGameState
+            cls = BitboardGameState
+        return super().__new__(cls)
+
+    def __init__(self, useBitboards=False):
         # Each element has 2 characters
         # First character represents color of the piece
         # Second character determines the type of the piece
@@ -31,19 +77,166 @@ class GameState():
         self.inCheck = False
         self.pins = []
         self.checks = []
+        self.attackedSquares = 0 # Bitmap of the squares the side not to move attacks, see getAttackedSquares
         self.checkmate = False
         self.stalemate = False
         self.enPassantPossible = () # Coordinates for the square where an en passant capture is possible
-        self.enPassantPossibleLog = [self.enPassantPossible]
         # Not if it's possible, just have you broken the rules fro castling before checking
-        self.currentCastlingRights = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRights.whiteKingSide, self.currentCastlingRights.blackKingSide,
-                                                   self.currentCastlingRights.whiteQueenSide, self.currentCastlingRights.blackQueenSide)]
+        self.castlingRights = ALL_CASTLING_RIGHTS
+        self.halfmoveClock = 0 # Moves since the last capture or pawn move, for the fifty move rule
+        self.fullmoveNumber = 1 # Goes up after each Black move
+        self.pieceCount = 32 # Pieces on the board, Kings included
+        # Position hash, kept up to date by makeMove/undoMove
+        self.zobristKey = self.computeZobristKey()
+        # Times each position (by hash) has been on the board this game, for repetitions. Positions from before
+        # a capture, pawn move or castling rights change can't come back, so their counts just never match again
+        self.positionCounts = {self.zobristKey: 1}
+        self.undoStack = [None] * (UNDO_RECORD_SIZE * UNDO_STACK_PLIES)
+        # Running evaluation terms (White's point of view), kept up to date by makeMove/undoMove
+        self.materialScore, self.positionScore = self.computeScores()
+
+    '''
+    Pickling support (worker processes): moveFunctions holds bound methods, rebuild it instead of pickling it
+    '''
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['moveFunctions']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.moveFunctions = {'P': self.getPawnMoves, 'R': self.getRookMoves, 'N': self.getKnightMoves,
+                              'B': self.getBishopMoves, 'Q': self.getQueenMoves, 'K': self.getKingMoves}
+
+    '''
+    A GameState set up from FEN (Forsyth-Edwards Notation), e.g. GameState.fromFen(START_FEN, useBitboards=True)
+    '''
+    @classmethod
+    def fromFen(cls, fen, useBitboards=False):
+        gameState = cls(useBitboards=useBitboards)
+        gameState.loadFen(fen)
+        return gameState
+
+    '''
+    Replace the position with the one in fen and start a fresh move log.
+    Only the piece placement is required, missing fields default to "w - - 0 1".
+    Raises ValueError unless each side has exactly one King, no pawn stands on the first or eighth rank and the side
+    that just moved isn't in check; castling rights without their King and Rook at home are dropped
+    '''
+    def loadFen(self, fen):
+        fields = fen.split()
+        ranks = fields[0].split("/") if fields else []
+        if len(ranks) != 8:
+            raise ValueError("FEN needs 8 ranks: " + fen)
+        if len(fields) > 1 and fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: " + fen)
+        board = []
+        for rankText in ranks:
+            row = []
+            for char in rankText:
+                if char.isdigit():
+                    row.extend(["--"] * int(char))
+                elif char.upper() in "PNBRQK":
+                    piece = ("w" if char.isupper() else "b") + char.upper()
+                    if piece == "wK":
+                        self.whiteKingLocation = (len(board), len(row))
+                    elif piece == "bK":
+                        self.blackKingLocation = (len(board), len(row))
+                    row.append(piece)
+                else:
+                    raise ValueError("Bad piece '" + char + "' in FEN: " + fen)
+            if len(row) != 8:
+                raise ValueError("FEN rank '" + rankText + "' isn't 8 squares: " + fen)
+            board.append(row)
+        for king in ("wK", "bK"):
+            if sum(row.count(king) for row in board) != 1:
+                raise ValueError("FEN needs exactly one " + ("White" if king == "wK" else "Black") + " King: " + fen)
+        if any(piece[1] == 'P' for piece in board[0] + board[7]):
+            raise ValueError("FEN has a pawn on the first or eighth rank: " + fen)
+        self.board = board
+        self.whiteToMove = len(fields) < 2 or fields[1] == "w"
+        # Board walking attack map, the bitboards aren't set up yet
+        kingRow, kingCol = self.blackKingLocation if self.whiteToMove else self.whiteKingLocation
+        if GameState.getAttackedSquares(self, "w" if self.whiteToMove else "b") >> (kingRow * 8 + kingCol) & 1:
+            raise ValueError("FEN side not to move is in check: " + fen)
+        castling = fields[2] if len(fields) > 2 else "-"
+        self.castlingRights = 0
+        for letter, right in castlingLetters:
+            if letter in castling:
+                self.castlingRights |= right
+        for row, col, piece in castlingHomes:
+            if board[row][col] != piece:
+                self.castlingRights &= castlingRightsMasks[row * 8 + col]
+        enPassant = fields[3] if len(fields) > 3 else "-"
+        if enPassant != "-":
+            if len(enPassant) != 2 or enPassant[0] not in Move.filesToCols or enPassant[1] not in Move.ranksToRows:
+                raise ValueError("Bad en passant square '" + enPassant + "' in FEN: " + fen)
+            self.enPassantPossible = (Move.ranksToRows[enPassant[1]], Move.filesToCols[enPassant[0]])
+        else:
+            self.enPassantPossible = ()
+        self.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        self.pieceCount = sum(piece != "--" for row in board for piece in row)
+        self.moveLog = []
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.checkmate = False
+        self.stalemate = False
+        self.zobristKey = self.computeZobristKey()
+        self.positionCounts = {self.zobristKey: 1}
+        self.materialScore, self.positionScore = self.computeScores()
+
+    '''
+    The position as a FEN string
+    '''
+    def toFen(self):
+        ranks = []
+        for row in self.board:
+            rankText = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rankText += str(empty)
+                    empty = 0
+                rankText += piece[1] if piece[0] == "w" else piece[1].lower()
+            if empty:
+                rankText += str(empty)
+            ranks.append(rankText)
+        castling = "".join(letter for letter, right in castlingLetters if self.castlingRights & right) or "-"
+        enPassant = Move.colsToFiles[self.enPassantPossible[1]] + Move.rowsToRanks[self.enPassantPossible[0]] \
+            if self.enPassantPossible else "-"
+        return " ".join(("/".join(ranks), "w" if self.whiteToMove else "b", castling, enPassant,
+                         str(self.halfmoveClock), str(self.fullmoveNumber)))
 
     '''
     Takes a move as a param and execute the move (won't work with castling, pawn promotions, and en-passant)
     '''
     def makeMove(self, move):
+        # Save what undoMove can't work out from the move itself
+        index = len(self.moveLog) * UNDO_RECORD_SIZE
+        undoStack = self.undoStack
+        if index == len(undoStack): # Out of room, double it
+            undoStack.extend([None] * len(undoStack))
+        undoStack[index] = self.castlingRights
+        undoStack[index + 1] = self.enPassantPossible
+        undoStack[index + 2] = self.zobristKey
+        undoStack[index + 3] = self.halfmoveClock
+        if move.pieceMoved[1] == 'P' or move.isCapture:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if move.isCapture:
+            self.pieceCount -= 1
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
+        # Take the old castling rights and en passant file out of the hash, put the new ones in at the end
+        key = self.zobristKey ^ zobristBlackToMove ^ zobristCastling[self.castlingRights]
+        if self.enPassantPossible:
+            key ^= zobristEnPassant[self.enPassantPossible[1]]
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move) # Log move so it can be undone later, can assume this move is legal
@@ -54,10 +247,9 @@ class GameState():
         if move.pieceMoved == "bK":
             self.blackKingLocation = (move.endRow, move.endCol)
 
-        # Pawn promotion
+        # Pawn promotion, the piece is part of the move so nothing has to be asked
         if move.pawnPromotion:
-            promotedPiece = input("Promote to Q, R, B, or N: ")
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + promotedPiece
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice
 
         # En Passant Move
         if move.isEnPassantMove:
@@ -70,8 +262,6 @@ class GameState():
         else:
             self.enPassantPossible = ()
 
-        self.enPassantPossibleLog.append(self.enPassantPossible)
-
         # Castle Moves
         if move.isCastleMove:
             if move.endCol - move.startCol == 2: # A King side castle
@@ -83,11 +273,31 @@ class GameState():
                 self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]
                 self.board[move.endRow][move.endCol - 2] = '--'
 
-        # Update Castling Rights -> Whenever a King or Rook moves
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(
-            CastleRights(self.currentCastlingRights.whiteKingSide, self.currentCastlingRights.blackKingSide,
-                         self.currentCastlingRights.whiteQueenSide, self.currentCastlingRights.blackQueenSide))
+        # Update Castling Rights -> Whenever a King or Rook moves, or a Rook is captured
+        self.castlingRights &= castlingRightsMasks[move.startRow * 8 + move.startCol] & \
+            castlingRightsMasks[move.endRow * 8 + move.endCol]
+
+        # Update the hash with the pieces that changed squares
+        pieceKeys = zobristPieces[move.pieceMoved]
+        key ^= pieceKeys[move.startRow * 8 + move.startCol]
+        key ^= zobristPieces[self.board[move.endRow][move.endCol]][move.endRow * 8 + move.endCol] # Promoted piece if any
+        if move.isCapture:
+            if move.isEnPassantMove:
+                key ^= zobristPieces[move.pieceCaptured][move.startRow * 8 + move.endCol]
+            else:
+                key ^= zobristPieces[move.pieceCaptured][move.endRow * 8 + move.endCol]
+        if move.isCastleMove:
+            rookKeys = zobristPieces[move.pieceMoved[0] + 'R']
+            if move.endCol - move.startCol == 2: # King Side
+                key ^= rookKeys[move.endRow * 8 + 7] ^ rookKeys[move.endRow * 8 + 5]
+            else: # Queen Side
+                key ^= rookKeys[move.endRow * 8] ^ rookKeys[move.endRow * 8 + 3]
+        key ^= zobristCastling[self.castlingRights]
+        if self.enPassantPossible:
+            key ^= zobristEnPassant[self.enPassantPossible[1]]
+        self.zobristKey = key
+        self.positionCounts[key] = self.positionCounts.get(key, 0) + 1
+        self.updateScores(move, 1)
 
 
     '''
@@ -110,15 +320,22 @@ class GameState():
             if move.isEnPassantMove:
                 self.board[move.endRow][move.endCol] = '--' # Leave landing square blank
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-            self.enPassantPossibleLog.pop()
-            self.enPassantPossible = self.enPassantPossibleLog[-1]
-
-            # Undo Castling Rights
-            self.castleRightsLog.pop() # Get's rid of new castle rights from move being undone
-            # Set current castle rights to the last one in the list (last state)
-            newRights = self.castleRightsLog[-1]
-            self.currentCastlingRights = CastleRights(newRights.whiteKingSide, newRights.blackKingSide,
-                                                      newRights.whiteQueenSide, newRights.blackQueenSide)
+            count = self.positionCounts[self.zobristKey] - 1
+            if count:
+                self.positionCounts[self.zobristKey] = count
+            else:
+                del self.positionCounts[self.zobristKey]
+            # Castling rights, en passant square, position hash and halfmove clock come back off the undo stack
+            index = len(self.moveLog) * UNDO_RECORD_SIZE
+            self.castlingRights = self.undoStack[index]
+            self.enPassantPossible = self.undoStack[index + 1]
+            self.zobristKey = self.undoStack[index + 2]
+            self.halfmoveClock = self.undoStack[index + 3]
+            if not self.whiteToMove:
+                self.fullmoveNumber -= 1
+            if move.isCapture:
+                self.pieceCount += 1
+            self.updateScores(move, -1)
             # Undo Castle Move
             if move.isCastleMove:
                 if move.endCol - move.startCol == 2: # King Side
@@ -132,42 +349,133 @@ class GameState():
             self.stalemate = False
 
     '''
-    Update castle rights given a move
-    '''
-    def updateCastleRights(self, move):
-        if move.pieceMoved == 'wK':
-            self.currentCastlingRights.whiteQueenSide = False
-            self.currentCastlingRights.whiteKingSide = False
-        elif move.pieceMoved == 'bK':
-            self.currentCastlingRights.blackKingSide = False
-            self.currentCastlingRights.blackQueenSide = False
-        elif move.pieceMoved == 'wR':
-            # Have to know which rook was moved
-            if move.startRow == 7:
-                if move.startCol == 0: # Left Rook
-                    self.currentCastlingRights.whiteQueenSide = False
-                if move.startCol == 7: # Right Rook
-                    self.currentCastlingRights.whiteKingSide = False
-        elif move.pieceMoved == 'bR':
-            # Have to know which rook was moved
-            if move.startRow == 0:
-                if move.startCol == 0: # Left Rook
-                    self.currentCastlingRights.blackQueenSide = False
-                if move.startCol == 7: # Right Rook
-                    self.currentCastlingRights.blackKingSide = False
-        # If a Rook is captured
-        if move.pieceCaptured == 'wR':
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentCastlingRights.whiteQueenSide = False
-                elif move.endCol == 7:
-                    self.currentCastlingRights.whiteKingSide = False
-            elif move.pieceCaptured == 'bR':
-                if move.endRow == 0:
-                    if move.endCol == 0:
-                        self.currentCastlingRights.blackQueenSide = False
-                    elif move.endCol == 7:
-                        self.currentCastlingRights.blackKingSide = False
+    Pass the turn without moving anything, for null move pruning in the search. Nothing goes in moveLog: returns the
+    en passant square it cleared, which undoNullMove needs back. The bitboards don't change so subclasses can use it as is
+    '''
+    def makeNullMove(self):
+        enPassantPossible = self.enPassantPossible
+        key = self.zobristKey ^ zobristBlackToMove
+        if enPassantPossible:
+            key ^= zobristEnPassant[enPassantPossible[1]]
+        self.zobristKey = key
+        self.enPassantPossible = ()
+        self.whiteToMove = not self.whiteToMove
+        return enPassantPossible
+
+    def undoNullMove(self, enPassantPossible):
+        key = self.zobristKey ^ zobristBlackToMove
+        if enPassantPossible:
+            key ^= zobristEnPassant[enPassantPossible[1]]
+        self.zobristKey = key
+        self.enPassantPossible = enPassantPossible
+        self.whiteToMove = not self.whiteToMove
+        self.checkmate = False
+        self.stalemate = False
+
+    '''
+    True if the side (White if white) has a Knight, Bishop, Rook or Queen. With only King and pawns zugzwang is common,
+    so the search doesn't try null moves there
+    '''
+    def hasNonPawnMaterial(self, white):
+        color = 'w' if white else 'b'
+        for row in self.board:
+            for piece in row:
+                if piece[0] == color and piece[1] != 'P' and piece[1] != 'K':
+                    return True
+        return False
+
+    '''
+    Why the game is drawn ("fifty move rule", "repetition" or "insufficient material"), None if it isn't.
+    Stalemate is left to getValidMoves, and a mate on the hundredth halfmove still counts, so call this after it
+    '''
+    def getDrawReason(self):
+        if self.halfmoveClock >= 100 and not self.checkmate:
+            return "fifty move rule"
+        if self.positionCounts.get(self.zobristKey, 0) >= 3:
+            return "repetition"
+        if self.isInsufficientMaterial():
+            return "insufficient material"
+        return None
+
+    '''
+    Neither side can ever mate: bare Kings, one Knight or Bishop, or only Bishops that all run on the same color
+    '''
+    def isInsufficientMaterial(self):
+        if self.pieceCount > 4:
+            return False
+        knights = 0
+        bishops = 0
+        bishopColors = set()
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece == "--" or piece[1] == 'K':
+                    continue
+                if piece[1] == 'B':
+                    bishops += 1
+                    bishopColors.add((row + col) % 2)
+                elif piece[1] == 'N':
+                    knights += 1
+                else: # A pawn, Rook or Queen can still mate
+                    return False
+        return knights + bishops <= 1 or (knights == 0 and len(bishopColors) == 1)
+
+    '''
+    Hash the whole position from scratch, makeMove/undoMove keep self.zobristKey equal to this
+    '''
+    def computeZobristKey(self):
+        key = 0
+        for row in range(len(self.board)):
+            for col in range(len(self.board[row])):
+                piece = self.board[row][col]
+                if piece != "--":
+                    key ^= zobristPieces[piece][row * 8 + col]
+        if not self.whiteToMove:
+            key ^= zobristBlackToMove
+        key ^= zobristCastling[self.castlingRights]
+        if self.enPassantPossible:
+            key ^= zobristEnPassant[self.enPassantPossible[1]]
+        return key
+
+    '''
+    Material and piece-square totals from scratch, makeMove/undoMove keep materialScore/positionScore equal to this
+    '''
+    def computeScores(self):
+        material = 0
+        position = 0
+        for row in range(len(self.board)):
+            for col in range(len(self.board[row])):
+                piece = self.board[row][col]
+                if piece != "--":
+                    material += pieceMaterialValues[piece]
+                    position += pieceSquareValues[piece][row * 8 + col]
+        return material, position
+
+    '''
+    Adds (sign 1, after makeMove) or takes back (sign -1, from undoMove) what a move changes in the scores
+    Only the squares the move touches: the moved piece, what it turns into, the captured piece and a castling rook
+    '''
+    def updateScores(self, move, sign):
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+        position = pieceSquareValues[move.pieceMoved][endSq] - pieceSquareValues[move.pieceMoved][startSq]
+        material = 0
+        if move.pawnPromotion:
+            promotedPiece = move.pieceMoved[0] + move.promotionChoice
+            material += pieceMaterialValues[promotedPiece] - pieceMaterialValues[move.pieceMoved]
+            position += pieceSquareValues[promotedPiece][endSq] - pieceSquareValues[move.pieceMoved][endSq]
+        if move.isCapture:
+            capturedSq = move.startRow * 8 + move.endCol if move.isEnPassantMove else endSq
+            material -= pieceMaterialValues[move.pieceCaptured]
+            position -= pieceSquareValues[move.pieceCaptured][capturedSq]
+        if move.isCastleMove:
+            rookValues = pieceSquareValues[move.pieceMoved[0] + 'R']
+            if move.endCol - move.startCol == 2: # King Side
+                position += rookValues[move.endRow * 8 + 5] - rookValues[move.endRow * 8 + 7]
+            else: # Queen Side
+                position += rookValues[move.endRow * 8 + 3] - rookValues[move.endRow * 8]
+        self.materialScore += sign * material
+        self.positionScore += sign * position
 
     '''
     Consider a pin against a King, the opponents piece that is pinned will see many "legal" moves it
@@ -178,6 +486,8 @@ class GameState():
     def getValidMoves(self):
         moves = []
         self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        # Squares the opponent attacks, worked out once here for the King move and castling checks
+        self.attackedSquares = self.getAttackedSquares('b' if self.whiteToMove else 'w')
         if self.whiteToMove:
             kingRow = self.whiteKingLocation[0]
             kingCol = self.whiteKingLocation[1]
@@ -186,28 +496,7 @@ class GameState():
             kingCol = self.blackKingLocation[1]
         if self.inCheck:
             if len(self.checks) == 1: # There is only 1 check. Can block it or move the king
-                moves = self.getAllPossibleMoves()
-                # To block a check we have to move a piece into one of the squares between the enemy piece and the King
-                check = self.checks[0] # Info about the check
-                checkRow = check[0]
-                checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol] # The enemy piece that is causing the check
-                validSquares = [] # Any squares that piece can move to
-                # If the enemy piece is a Knight, must take or move King, anything else can be blocked
-                if pieceChecking[1] == 'N':
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1, 8): # Produces a list of coords that result in blocking the check
-                        # Can move along the direction of the attacking piece until you hit the attacking piece
-                        validSquare = (kingRow + check[2] * i, kingCol + check[3] * i) # check[2] and check [3] are the check directions
-                        validSquares.append(validSquare)
-                        if validSquare[0] == checkRow and validSquare[1] == checkCol: # Where we hit the attacking piece
-                            break
-                # Get rid of moves that don't block check or move the King
-                for i in range(len(moves) -1, -1, -1):
-                    if moves[i].pieceMoved[1] != 'K': # The move doesn't move the King so it HAS to block or capture
-                        if not (moves[i].endRow, moves[i].endCol) in validSquares: # Move doesn't block check or capture the piece
-                            moves.remove((moves[i]))
+                self.getCheckEvasions(kingRow, kingCol, moves)
                 # If no moves in "moves" and in check, then are in checkmate
                 if len(moves) == 0:
                     self.checkmate = True
@@ -218,15 +507,89 @@ class GameState():
                     self.checkmate = True
         else: # Not in check so any move is fine
             moves = self.getAllPossibleMoves()
-        if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves, "w")
-        else:
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves, "b")
+            if self.whiteToMove:
+                self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves, "w")
+            else:
+                self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves, "b")
         # If not in check, but can't make any moves, it's stalemate
         if not self.inCheck and len(moves) == 0:
             self.stalemate = True
         return moves
 
+    '''
+    Moves out of a single check: King moves, captures of the checking piece and blocks on the squares between it and
+    the King. Instead of generating every move and throwing most away, it looks outwards from each of those target
+    squares for the pieces that can reach them. Pinned pieces can never help, they're skipped
+    '''
+    def getCheckEvasions(self, kingRow, kingCol, moves):
+        self.getKingMoves(kingRow, kingCol, moves)
+        checkRow, checkCol, checkRowDir, checkColDir = self.checks[0]
+        pieceChecking = self.board[checkRow][checkCol]
+        targetSquares = [(checkRow, checkCol)]
+        if pieceChecking[1] != 'N': # Anything but a Knight can be blocked
+            for i in range(1, 8):
+                square = (kingRow + checkRowDir * i, kingCol + checkColDir * i)
+                if square == (checkRow, checkCol):
+                    break
+                targetSquares.append(square)
+        pinnedSquares = [(pin[0], pin[1]) for pin in self.pins]
+        if self.whiteToMove:
+            allyColor = 'w'
+            moveAmount = -1
+            startRow = 6
+            backRow = 0
+        else:
+            allyColor = 'b'
+            moveAmount = 1
+            startRow = 1
+            backRow = 7
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for endRow, endCol in targetSquares:
+            # Knights
+            for m in knightMoves:
+                row = endRow + m[0]
+                col = endCol + m[1]
+                if 0 <= row < 8 and 0 <= col < 8 and self.board[row][col] == allyColor + 'N' and \
+                        (row, col) not in pinnedSquares:
+                    moves.append(Move((row, col), (endRow, endCol), self.board))
+            # Rooks, Bishops and Queens: the first piece in each direction, if it slides that way
+            for j in range(len(directions)):
+                d = directions[j]
+                for i in range(1, 8):
+                    row = endRow + d[0] * i
+                    col = endCol + d[1] * i
+                    if not (0 <= row < 8 and 0 <= col < 8):
+                        break
+                    piece = self.board[row][col]
+                    if piece != "--":
+                        if piece[0] == allyColor and (piece[1] == 'Q' or piece[1] == ('R' if j <= 3 else 'B')) and \
+                                (row, col) not in pinnedSquares:
+                            moves.append(Move((row, col), (endRow, endCol), self.board))
+                        break
+            # Pawns: captures onto the checking piece, pushes onto the empty squares
+            pawnPromotion = endRow == backRow
+            row = endRow - moveAmount
+            if (endRow, endCol) == (checkRow, checkCol):
+                for col in (endCol - 1, endCol + 1):
+                    if 0 <= row < 8 and 0 <= col < 8 and self.board[row][col] == allyColor + 'P' and \
+                            (row, col) not in pinnedSquares:
+                        self.addPawnMove((row, col), (endRow, endCol), pawnPromotion, moves)
+            elif 0 <= row < 8:
+                if self.board[row][endCol] == allyColor + 'P':
+                    if (row, endCol) not in pinnedSquares:
+                        self.addPawnMove((row, endCol), (endRow, endCol), pawnPromotion, moves)
+                elif self.board[row][endCol] == "--" and row - moveAmount == startRow and \
+                        self.board[startRow][endCol] == allyColor + 'P' and (startRow, endCol) not in pinnedSquares:
+                    moves.append(Move((startRow, endCol), (endRow, endCol), self.board))
+        # En passant takes a checking pawn without landing on its square, getPawnMoves knows when it's legal
+        if pieceChecking[1] == 'P' and self.enPassantPossible == (checkRow + moveAmount, checkCol):
+            for col in (checkCol - 1, checkCol + 1):
+                if 0 <= col < 8 and self.board[checkRow][col] == allyColor + 'P' and (checkRow, col) not in pinnedSquares:
+                    pawnMoves = []
+                    self.getPawnMoves(checkRow, col, pawnMoves)
+                    moves.extend(move for move in pawnMoves if move.isEnPassantMove)
+
     def checkForPinsAndChecks(self):
         pins = [] # Square where the allied pinned piece is and direction pinned from
         checks = [] # Squares where the enemy is applying a check
@@ -303,14 +666,78 @@ class GameState():
     Determines if the enemy can attack the square
     '''
     def squareUnderAttack(self, row, col):
-        self.whiteToMove = not self.whiteToMove # Switch to opp pov
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove # Switch back
-        for move in oppMoves:
-            if move.endRow == row and move.endCol == col: # Square is under attack
+        # Look outwards from the square for an enemy piece that could capture on it
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        pawnRow = row + (-1 if self.whiteToMove else 1) # Enemy pawns attack towards our side
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(len(directions)):
+            d = directions[j]
+            for i in range(1, 8):
+                endRow = row + d[0] * i
+                endCol = col + d[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                endPiece = self.board[endRow][endCol]
+                if endPiece != "--":
+                    if endPiece[0] == enemyColor:
+                        type = endPiece[1]
+                        if type == 'Q' or type == ('R' if j <= 3 else 'B') or (i == 1 and type == 'K') or \
+                                (i == 1 and type == 'P' and j >= 4 and endRow == pawnRow):
+                            return True
+                    break
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        for m in knightMoves:
+            endRow = row + m[0]
+            endCol = col + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and self.board[endRow][endCol] == enemyColor + 'N':
                 return True
         return False
 
+    '''
+    Every square the given color attacks, as a bitmap (bit row * 8 + col). The other side's King doesn't block the
+    rays, so a square behind it along a check line counts as attacked and the King can't step back onto it
+    '''
+    def getAttackedSquares(self, color):
+        attacked = 0
+        kingInTheWay = ('b' if color == 'w' else 'w') + 'K'
+        pawnRow = -1 if color == 'w' else 1
+        orthogonal = ((-1, 0), (0, -1), (1, 0), (0, 1))
+        diagonal = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        kingMoves = orthogonal + diagonal
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece[0] != color:
+                    continue
+                type = piece[1]
+                if type == 'P':
+                    endRow = row + pawnRow
+                    if 0 <= endRow < 8:
+                        if col > 0:
+                            attacked |= 1 << (endRow * 8 + col - 1)
+                        if col < 7:
+                            attacked |= 1 << (endRow * 8 + col + 1)
+                elif type == 'N' or type == 'K':
+                    for m in (knightMoves if type == 'N' else kingMoves):
+                        endRow = row + m[0]
+                        endCol = col + m[1]
+                        if 0 <= endRow < 8 and 0 <= endCol < 8:
+                            attacked |= 1 << (endRow * 8 + endCol)
+                else:
+                    directions = orthogonal if type == 'R' else diagonal if type == 'B' else kingMoves
+                    for d in directions:
+                        endRow = row + d[0]
+                        endCol = col + d[1]
+                        while 0 <= endRow < 8 and 0 <= endCol < 8:
+                            attacked |= 1 << (endRow * 8 + endCol)
+                            endPiece = self.board[endRow][endCol]
+                            if endPiece != "--" and endPiece != kingInTheWay:
+                                break
+                            endRow += d[0]
+                            endCol += d[1]
+        return attacked
+
     '''
     All legal moves without considering checks
     '''
@@ -344,22 +771,18 @@ class GameState():
             startRow = 1
             backRow = 7
             enemyColor = 'w'
-            kingRow, kingCol = self.whiteKingLocation
-        pawnPromotion = False
+            kingRow, kingCol = self.blackKingLocation
+        pawnPromotion = row + moveAmount == backRow # If piece gets to back rank then it's a pawn promotion
 
         if self.board[row + moveAmount][col] == "--": # 1 Square Move
-            if not piecePinned or pinDirection == (moveAmount, 0):
-                if row + moveAmount == backRow: # If piece gets to back rank then it's a pawn promotion
-                    pawnPromotion = True
-                moves.append(Move((row, col), (row + moveAmount, col), self.board, pawnPromotion=pawnPromotion))
+            if not piecePinned or pinDirection == (moveAmount, 0) or pinDirection == (-moveAmount, 0):
+                self.addPawnMove((row, col), (row + moveAmount, col), pawnPromotion, moves)
                 if row == startRow and self.board[row + (2 * moveAmount)][col] == "--":
                     moves.append(Move((row, col), (row + (2 * moveAmount), col), self.board))
         if col - 1 >= 0: # Capture to the left
             if not piecePinned or pinDirection == (moveAmount, -1):
                 if self.board[row + moveAmount][col - 1][0] == enemyColor:
-                    if row + moveAmount == backRow: # Pawn Promotion
-                        pawnPromotion = True
-                    moves.append(Move((row, col), (row + moveAmount, col - 1), self.board, pawnPromotion=pawnPromotion))
+                    self.addPawnMove((row, col), (row + moveAmount, col - 1), pawnPromotion, moves)
                 if (row + moveAmount, col - 1) == self.enPassantPossible: # En Passant is possible
                     isAttackingPiece = isBlockingPiece = False
                     if kingRow == row:
@@ -377,16 +800,16 @@ class GameState():
                             square = self.board[row][i]
                             if square[0] == enemyColor and (square[1] == "R" or square[1] == "Q"): # Is attacking piece
                                 isAttackingPiece = True
-                            elif square != "--":
+                                break
+                            elif square != "--": # Only the first piece outside can matter
                                 isBlockingPiece = True
+                                break
                     if not isAttackingPiece or isBlockingPiece:
                         moves.append(Move((row, col), (row + moveAmount, col - 1), self.board, enPassant=True))
         if col + 1 <= 7: # Capture to the right
             if not piecePinned or pinDirection == (moveAmount, 1):
                 if self.board[row + moveAmount][col + 1][0] == enemyColor:
-                    if row + moveAmount == backRow: # Pawn Promotion
-                        pawnPromotion = True
-                    moves.append(Move((row, col), (row + moveAmount, col + 1), self.board, pawnPromotion=pawnPromotion))
+                    self.addPawnMove((row, col), (row + moveAmount, col + 1), pawnPromotion, moves)
                 if (row + moveAmount, col + 1) == self.enPassantPossible:
                     isAttackingPiece = isBlockingPiece = False
                     if kingRow == row:
@@ -404,11 +827,23 @@ class GameState():
                             square = self.board[row][i]
                             if square[0] == enemyColor and (square[1] == "R" or square[1] == "Q"):  # Is attacking piece
                                 isAttackingPiece = True
-                            elif square != "--":
+                                break
+                            elif square != "--":  # Only the first piece outside can matter
                                 isBlockingPiece = True
+                                break
                     if not isAttackingPiece or isBlockingPiece:
                         moves.append(Move((row, col), (row + moveAmount, col + 1), self.board, enPassant=True))
 
+    '''
+    Appends a pawn move, or one move per piece the pawn can promote to
+    '''
+    def addPawnMove(self, startSq, endSq, pawnPromotion, moves):
+        if pawnPromotion:
+            for piece in Move.promotionPieces:
+                moves.append(Move(startSq, endSq, self.board, promotionChoice=piece))
+        else:
+            moves.append(Move(startSq, endSq, self.board))
+
     '''
     Get Rook moves given starting square, append to "moves"
     '''
@@ -510,63 +945,47 @@ class GameState():
         rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
         colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
         allyColor = "w" if self.whiteToMove else "b"
+        attackedSquares = self.attackedSquares # Set by getValidMoves
         for i in range(8):
             endRow = row + rowMoves[i]
             endCol = col + colMoves[i]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor: # Not an ally piece (empty or enemy piece)
-                    if allyColor == "w": # Place King on end square and check for checks
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-                    inCheck, pins, checks = self.checkForPinsAndChecks()
-                    if not inCheck:
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-                    # Place King back at original location
-                    if allyColor == "w":
-                        self.whiteKingLocation = (row, col)
-                    else:
-                        self.blackKingLocation = (row, col)
+                # Not an ally piece (empty or enemy piece) and the King wouldn't be in check there
+                if endPiece[0] != allyColor and not attackedSquares >> (endRow * 8 + endCol) & 1:
+                    moves.append(Move((row, col), (endRow, endCol), self.board))
 
     '''
     Generates all valid castle moves for king at (row, col), and add to list of moves'''
     def getCastleMoves(self, row, col, moves, allyColor):
-        if self.squareUnderAttack(row, col):
+        if self.attackedSquares >> (row * 8 + col) & 1:
             return # Can't castle while in check
-        if ((self.whiteToMove and self.currentCastlingRights.whiteKingSide) or
-                (not self.whiteToMove and self.currentCastlingRights.blackKingSide)):
+        if self.castlingRights & (WHITE_KING_SIDE if self.whiteToMove else BLACK_KING_SIDE):
             self.getKingSideCastleMoves(row, col, moves, allyColor)
-        if ((self.whiteToMove and self.currentCastlingRights.whiteQueenSide) or
-                (not self.whiteToMove and self.currentCastlingRights.blackQueenSide)):
+        if self.castlingRights & (WHITE_QUEEN_SIDE if self.whiteToMove else BLACK_QUEEN_SIDE):
             self.getQueenSideCastleMoves(row, col, moves, allyColor)
 
     def getKingSideCastleMoves(self, row, col, moves, allyColor):
         # Don't need to check if moves are off board because otherwise castlingRights wouldn't be True
         if self.board[row][col + 1] == '--' and self.board[row][col + 2] == '--':
-            if not self.squareUnderAttack(row, col + 1) and not self.squareUnderAttack(row, col + 2):
+            if not self.attackedSquares >> (row * 8 + col + 1) & 3: # Both squares the King crosses
                 moves.append(Move((row, col), (row, col + 2), self.board, isCastleMove=True))
 
     def getQueenSideCastleMoves(self, row, col, moves, allyColor):
         if self.board[row][col - 1] == '--' and self.board[row][col - 2] == '--' and self.board[row][col - 3] == '--':
-            if not self.squareUnderAttack(row, col - 1) and not self.squareUnderAttack(row, col - 2):
+            if not self.attackedSquares >> (row * 8 + col - 2) & 3:
                 moves.append(Move((row, col), (row, col - 2), self.board, isCastleMove=True))
 
 
 
 
 
-class CastleRights:
-    def __init__(self, whiteKingSide, blackKingSide, whiteQueenSide, blackQueenSide):
-        self.whiteKingSide = whiteKingSide
-        self.blackKingSide = blackKingSide
-        self.whiteQueenSide = whiteQueenSide
-        self.blackQueenSide = blackQueenSide
-
-
 '''
 Creating a Move class helps to create chess notation, and deal with castling, en passant, etc.'''
 class Move():
+    # No per move __dict__, search creates a lot of these
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured', 'pawnPromotion',
+                 'promotionChoice', 'isEnPassantMove', 'isCastleMove', 'isCapture', 'moveID')
 
     # maps keys to value
     # key : value
@@ -574,19 +993,20 @@ class Move():
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
+    promotionPieces = ('Q', 'R', 'B', 'N')
+    promotionCodes = {'Q': 1, 'R': 2, 'B': 3, 'N': 4} # Keeps moves to the same square with different pieces apart
+    moveIDCount = 5 << 12 # Every moveID is below this, so it can index a flat table
 
-    def __init__(self, startSq, endSq, board, enPassant=False, pawnPromotion=False, isCastleMove=False):
+    def __init__(self, startSq, endSq, board, enPassant=False, promotionChoice='Q', isCastleMove=False):
         self.startRow = startSq[0]
         self.startCol = startSq[1]
         self.endRow = endSq[0]
         self.endCol = endSq[1]
         self.pieceMoved = board[self.startRow][self.startCol]
         self.pieceCaptured = board[self.endRow][self.endCol]
-        # Pawn Promotion
-        self.pawnPromotion = False
-        if (self.pieceMoved == 'wP' and self.endRow == 0) or (self.pieceMoved == 'bP' and self.endRow == 7):
-            # Pawn made it to the end
-            self.pawnPromotion = True
+        # Pawn Promotion, the pawn made it to the end
+        self.pawnPromotion = (self.pieceMoved == 'wP' and self.endRow == 0) or (self.pieceMoved == 'bP' and self.endRow == 7)
+        self.promotionChoice = promotionChoice if self.pawnPromotion else None # Piece the pawn becomes
         # En Passant
         self.isEnPassantMove = enPassant
         if self.isEnPassantMove:
@@ -601,20 +1021,29 @@ class Move():
             self.isEnPassantMove = True
         '''
 
-        # Kind of like a Hash Function
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        # Kind of like a Hash Function: start square in bits 0-5, end square in bits 6-11, promotion piece above
+        self.moveID = self.startRow * 8 + self.startCol | (self.endRow * 8 + self.endCol) << 6
+        if self.pawnPromotion:
+            self.moveID |= self.promotionCodes[self.promotionChoice] << 12
 
     '''
     Overriding the Equals method
     '''
 
     def __eq__(self, other):
-        if isinstance(other, Move):
+        try:
             return self.moveID == other.moveID
-        return False
+        except AttributeError: # None (no killer/hash move yet) or something that isn't a move
+            return False
+
+    def __hash__(self):
+        return self.moveID
 
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.pawnPromotion:
+            notation += self.promotionChoice.lower() # e7e8q
+        return notation
 
     def getRankFile(self, row, col):
         return self.colsToFiles[col] + self.rowsToRanks[row]
@@ -631,9 +1060,10 @@ class Move():
         # Pawn Moves
         if self.pieceMoved[1] == 'P':
             if self.isCapture:
-                return self.colsToFiles[self.startCol] + "x" + endSquare
-            else:
-                return endSquare
+                endSquare = self.colsToFiles[self.startCol] + "x" + endSquare
+            if self.pawnPromotion:
+                endSquare += "=" + self.promotionChoice
+            return endSquare
 
         # Piece Moves
         moveString = self.pieceMoved[1]
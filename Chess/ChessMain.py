@@ -4,7 +4,9 @@
 - Display Current Game State object
 """
 
+import pickle
 import pygame as p
+from multiprocessing import Event, Process, Queue
 from Chess import ChessEngine, ChessAI
 
 
@@ -17,6 +19,8 @@ MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
 DIMENSION = 8 # 8x8 Board
 SQ_SIZE = BOARD_HEIGHT // DIMENSION
 MAX_FPS = 15 #For animations
+AI_TIME_LIMIT = 2 # Seconds the AI may think per move
+USE_BITBOARDS = True # Bitboard move generator (Chess.bitboards), False for the original board walking one
 IMAGES = {}
 
 '''
@@ -46,7 +50,7 @@ def main():
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
     moveLogFont = p.font.SysFont("Arial", 12, True, False)
-    gameState = ChessEngine.GameState()
+    gameState = ChessEngine.GameState(useBitboards=USE_BITBOARDS)
     validMoves = gameState.getValidMoves()
     moveMade = False # Flag Variable for when a VALID move is made
     animate = False # Flag variable for when a move should be animated
@@ -57,6 +61,12 @@ def main():
     gameOver = False
     playerOne = False # If a Human is playing white, then this will be true, If an AI is playing than false
     playerTwo = False # Same for black
+    AIThinking = False # True while the worker process is searching for the AI's move
+    moveFinderProcess = None # Started on the AI's first move and kept for the whole game, so its Searcher's tables last
+    requestQueue = None
+    returnQueue = None
+    stopEvent = None # Set to stop the worker's search of a position that was undone or reset
+    searchID = 0 # Numbers each search request, results for an older one (position undone or reset) are thrown away
     while running:
         humanTurn = (gameState.whiteToMove and playerOne) or (not gameState.whiteToMove and playerTwo)
         for e in p.event.get():
@@ -78,10 +88,16 @@ def main():
                         playerClicks.append(sqSelected) # Append for both first and second clicks
                     if len(playerClicks) == 2: # After the second click
                         move = ChessEngine.Move(playerClicks[0], playerClicks[1], gameState.board)
-                        print(move.getChessNotation())
+                        if move.pawnPromotion and move in validMoves: # Only ask about a move that can be played
+                            promotionChoice = askPromotionPiece(screen, clock, move.pieceMoved[0])
+                            # None (picker closed) leaves the move unmade
+                            move = ChessEngine.Move(playerClicks[0], playerClicks[1], gameState.board,
+                                                    promotionChoice=promotionChoice) if promotionChoice else None
+                        if move is not None:
+                            print(move.getChessNotation())
                         # This will be the move generated by the engine
                         for i in range(len(validMoves)):
-                            if move == validMoves[i]:
+                            if move is not None and move == validMoves[i]:
                                 gameState.makeMove(validMoves[i])
                                 moveMade = True
                                 animate = True
@@ -93,12 +109,18 @@ def main():
             # Key Handlers
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z: # Undo when 'z' is pressed
+                    if AIThinking: # Stop the search for the position being undone, its answer is thrown away
+                        stopEvent.set()
+                        AIThinking = False
                     gameState.undoMove()
                     moveMade = True
                     animate = False
                     gameOver = False
                 if e.key == p.K_r: # Reset the board when 'r' is pressed
-                    gameState = ChessEngine.GameState()
+                    if AIThinking:
+                        stopEvent.set()
+                        AIThinking = False
+                    gameState = ChessEngine.GameState(useBitboards=USE_BITBOARDS)
                     validMoves = gameState.getValidMoves()
                     sqSelected = ()
                     playerClicks = []
@@ -106,14 +128,33 @@ def main():
                     animate = False
                     gameOver = False
 
-        # AI move finder
-        if not gameOver and not humanTurn:
-            AIMove = ChessAI.findBestMove(gameState, validMoves)
-            if AIMove is None: # Shouldn't happen, but if the AI think's it has no chance, then just make random moves
-                AIMove = ChessAI.findRandomMove(validMoves)
-            gameState.makeMove(AIMove)
-            moveMade = True
-            animate = True
+        # AI move finder, runs in its own process so the window keeps drawing and handling events
+        if not gameOver and not humanTurn and not moveMade: # validMoves is stale until moveMade is handled
+            if not AIThinking:
+                AIThinking = True
+                if moveFinderProcess is None:
+                    requestQueue = Queue() # Used to pass data between processes
+                    returnQueue = Queue()
+                    stopEvent = Event()
+                    # Daemon so closing the window doesn't wait for the search
+                    moveFinderProcess = Process(target=moveFinderLoop, args=(requestQueue, returnQueue, stopEvent),
+                                                daemon=True)
+                    moveFinderProcess.start()
+                searchID += 1
+                # Pickled now: the queue pickles in a background thread, by then an undo could have changed gameState
+                requestQueue.put((searchID, pickle.dumps((gameState, validMoves))))
+            elif not returnQueue.empty(): # A search is done
+                resultID, AIMove = returnQueue.get()
+                if resultID == searchID: # Not the search of a position since undone or reset
+                    AIThinking = False
+                    if AIMove is None: # Shouldn't happen, but if the AI think's it has no chance, then just make random moves
+                        AIMove = ChessAI.findRandomMove(validMoves)
+                    for move in validMoves: # The worker sent back a copy, make the matching move from this process
+                        if move == AIMove and move.isCastleMove == AIMove.isCastleMove:
+                            gameState.makeMove(move)
+                            break
+                    moveMade = True
+                    animate = True
 
         if moveMade:
             if animate:
@@ -123,10 +164,14 @@ def main():
             animate = False
 
         drawGameState(screen, gameState, validMoves, sqSelected, moveLogFont)
+        if AIThinking:
+            drawThinkingText(screen, moveLogFont)
 
-        if gameState.checkmate or gameState.stalemate:
+        drawReason = gameState.getDrawReason()
+        if gameState.checkmate or gameState.stalemate or drawReason is not None:
             gameOver = True
             text = 'Stalemate!' if gameState.stalemate \
+                else 'Draw by ' + drawReason + '!' if not gameState.checkmate \
                 else 'Black got bodied!' if gameState.whiteToMove \
                 else 'White got bodied!'
             drawEndGameText(screen, text)
@@ -136,6 +181,23 @@ def main():
         p.display.flip()
 
 
+'''
+Runs in the worker process for the whole game: takes (searchID, pickled (gameState, validMoves)) from requestQueue
+and sends (searchID, the AI's move) back through returnQueue. The process's Searcher keeps its transposition table,
+killers and history from one move to the next; setting stopEvent cuts its current search short
+'''
+
+
+def moveFinderLoop(requestQueue, returnQueue, stopEvent):
+    ChessAI.getSearcher().stopEvent = stopEvent
+    while True:
+        searchID, state = requestQueue.get()
+        gameState, validMoves = pickle.loads(state)
+        move = ChessAI.findBestMove(gameState, validMoves, time_limit=AI_TIME_LIMIT)
+        stopEvent.clear() # A stop meant for this search has done its job
+        returnQueue.put((searchID, move))
+
+
 '''
 Responsible for graphics within a current gameState
 '''
@@ -252,6 +314,48 @@ def animateMove(move, screen, board, clock):
         p.display.flip()
         clock.tick(60)
 
+def drawThinkingText(screen, font):
+    textObject = font.render("AI thinking...", True, p.Color("dark green"))
+    textLocation = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT).move(
+        5, MOVE_LOG_PANEL_HEIGHT - textObject.get_height() - 5) # Bottom of the move log panel
+    screen.blit(textObject, textLocation)
+
+'''
+Promotion picker: the four pieces the pawn can become, drawn over the middle of the board. Waits for a click on one
+of them or its letter key (q, r, b, n) and returns 'Q', 'R', 'B' or 'N'; Escape, a click elsewhere or closing the
+window returns None
+'''
+
+
+def askPromotionPiece(screen, clock, color):
+    keys = {p.K_q: 'Q', p.K_r: 'R', p.K_b: 'B', p.K_n: 'N'}
+    left = BOARD_WIDTH // 2 - 2 * SQ_SIZE
+    top = BOARD_HEIGHT // 2 - SQ_SIZE // 2
+    for i, piece in enumerate(ChessEngine.Move.promotionPieces):
+        square = p.Rect(left + i * SQ_SIZE, top, SQ_SIZE, SQ_SIZE)
+        p.draw.rect(screen, p.Color("light gray"), square)
+        p.draw.rect(screen, p.Color("dark green"), square, 2)
+        screen.blit(IMAGES[color + piece], square)
+    p.display.flip()
+    while True:
+        for e in p.event.get():
+            if e.type == p.QUIT:
+                p.event.post(e) # Let the main loop close the window
+                return None
+            elif e.type == p.KEYDOWN:
+                if e.key in keys:
+                    return keys[e.key]
+                if e.key == p.K_ESCAPE:
+                    return None
+            elif e.type == p.MOUSEBUTTONDOWN:
+                x, y = p.mouse.get_pos()
+                index = (x - left) // SQ_SIZE
+                if top <= y < top + SQ_SIZE and 0 <= index < 4 and x >= left:
+                    return ChessEngine.Move.promotionPieces[index]
+                return None
+        clock.tick(MAX_FPS)
+
+
 def drawEndGameText(screen, text):
     font = p.font.SysFont("Helvitca", 50, True, False)
     textObject = font.render(text, 0, p.Color("white"))
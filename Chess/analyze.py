@@ -0,0 +1,152 @@
+"""
+- Headless batch analysis: searches every position in an EPD/FEN file (or stdin) and prints one JSON line per position
+- Positions are spread over a process pool, results are printed as they finish (so not in input order, see "index")
+- python -m Chess.analyze positions.epd -t 1         one second per position on every core
+- python -m Chess.analyze -d 4 -w 2 < positions.fen  depth 4, two processes
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from Chess import ChessAI, ChessEngine
+
+# Each pool process searches with its own Searcher, its tables are reused from one position to the next
+analysisSearcher = None
+analysisUseBitboards = True
+
+
+def initAnalysisWorker(depth, ttSizeMB, useBitboards):
+    global analysisSearcher, analysisUseBitboards
+    analysisSearcher = ChessAI.Searcher(depth=depth, ttSizeMB=ttSizeMB)
+    analysisUseBitboards = useBitboards
+
+
+'''
+Yields (index, fen, id) for every position in the lines, skipping blank lines and # comments.
+A full FEN has six fields; an EPD line has four, then operations like: bm Nf3; id "test 1";
+'''
+def readPositions(lines):
+    index = 0
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split()
+        positionId = None
+        if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+            fen = " ".join(fields[:6])
+        else: # EPD, the move counters aren't part of it
+            fen = " ".join(fields[:4])
+            for operation in " ".join(fields[4:]).split(";"):
+                operation = operation.strip()
+                if operation.startswith("id "):
+                    positionId = operation[3:].strip().strip('"')
+        yield index, fen, positionId
+        index += 1
+
+
+'''
+Runs in a pool process (or in this one with a single worker): search one position, return its result as a dict.
+The score is in pawns from the point of view of the side to move. A position that can't be read or searched
+gets an "error" entry instead, so one bad line doesn't stop the batch
+'''
+def analysePosition(index, fen, positionId, timeLimit):
+    result = {"index": index, "fen": fen}
+    if positionId is not None:
+        result["id"] = positionId
+    try:
+        gameState = ChessEngine.GameState.fromFen(fen, useBitboards=analysisUseBitboards)
+    except (ValueError, KeyError, IndexError) as e:
+        result["error"] = "bad position: " + str(e)
+        return result
+    try:
+        result.update(searchPosition(gameState, timeLimit))
+    except Exception as e:
+        result["error"] = "search failed: " + type(e).__name__ + (": " + str(e) if str(e) else "")
+    return result
+
+
+'''
+The search part of analysePosition: best move, score, principal variation and stats for gameState
+'''
+def searchPosition(gameState, timeLimit):
+    validMoves = gameState.getValidMoves()
+    startTime = time.perf_counter()
+    if validMoves:
+        searcher = analysisSearcher
+        bestMove = searcher.findBestMove(gameState, validMoves, time_limit=timeLimit)
+        score = searcher.score
+        pv = [move.getChessNotation() for move in searcher.principalVariation]
+        depth = searcher.completedDepth
+        nodes = searcher.nodes
+    else: # Game over, nothing to search
+        bestMove = None
+        score = -ChessAI.CHECKMATE if gameState.checkmate else ChessAI.STALEMATE
+        pv = []
+        depth = 0
+        nodes = 0
+    elapsed = time.perf_counter() - startTime
+    return {"bestMove": bestMove.getChessNotation() if bestMove is not None else None,
+            "score": round(score, 2), "pv": pv, "depth": depth, "nodes": nodes,
+            "nps": int(nodes / max(elapsed, 1e-9)), "time": round(elapsed, 3)}
+
+
+'''
+Analyse every position from lines, calling report(result) as each one finishes. Never has more than
+a few positions per process queued, so memory stays flat however long the input is
+'''
+def runAnalysis(lines, report, depth=ChessAI.DEPTH, timeLimit=None, workers=1, ttSizeMB=ChessAI.TT_SIZE_MB,
+                useBitboards=True):
+    positions = readPositions(lines)
+    if workers <= 1:
+        initAnalysisWorker(depth, ttSizeMB, useBitboards)
+        for index, fen, positionId in positions:
+            report(analysePosition(index, fen, positionId, timeLimit))
+        return
+
+    maxPending = workers * 2 # Enough to keep every process busy
+    with ProcessPoolExecutor(max_workers=workers, initializer=initAnalysisWorker,
+                             initargs=(depth, ttSizeMB, useBitboards)) as pool:
+        pending = set()
+        for index, fen, positionId in positions:
+            pending.add(pool.submit(analysePosition, index, fen, positionId, timeLimit))
+            if len(pending) >= maxPending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report(future.result())
+        for future in wait(pending).done:
+            report(future.result())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a file of FEN/EPD positions and print JSON lines")
+    parser.add_argument("file", nargs="?", help="FEN or EPD file, one position per line (default: stdin)")
+    parser.add_argument("-d", "--depth", type=int, default=ChessAI.DEPTH,
+                        help="Search depth when there is no time limit (default %d)" % ChessAI.DEPTH)
+    parser.add_argument("-t", "--time", type=float, help="Seconds per position, overrides --depth")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes to search with (default: one per core)")
+    parser.add_argument("--hash", type=float, default=ChessAI.TT_SIZE_MB,
+                        help="Transposition table MB per process (default %g)" % ChessAI.TT_SIZE_MB)
+    parser.add_argument("--legacy", action="store_true", help="Use the board walking generator instead of bitboards")
+    args = parser.parse_args(argv)
+
+    def report(result):
+        print(json.dumps(result), flush=True)
+
+    lines = open(args.file) if args.file else sys.stdin
+    try:
+        runAnalysis(lines, report, depth=args.depth, timeLimit=args.time, workers=args.workers, ttSizeMB=args.hash,
+                    useBitboards=not args.legacy)
+    finally:
+        if args.file:
+            lines.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
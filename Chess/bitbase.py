@@ -0,0 +1,410 @@
+"""
+- Win/draw bitbases for King and Queen, King and Rook, King and pawn against a lone King (KQK, KRK, KPK)
+- Built by retrograde analysis: start from the mates and work backwards to every position the piece side can force
+  one from. KPK is built last, a promotion wins when the KQK or KRK table says so
+- One bit per position and side to move (set: the side with the piece wins, the lone King can only draw),
+  64 KB per file. The files are memory mapped, a probe reads one byte
+- Generation is vectorised with NumPy when it's installed, otherwise a slower pure Python version is used
+- python -m Chess.bitbase build -o bitbases          writes kqk.bb, krk.bb and kpk.bb to the bitbases directory
+- python -m Chess.bitbase probe --fen "8/8/8/4k3/8/8/4P3/4K3 w - - 0 1"
+"""
+
+import argparse
+import mmap
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError: # Optional, only makes building faster
+    np = None
+
+from Chess import ChessEngine
+
+BITBASE_DIR = "bitbases"
+PIECE_TYPES = ("Q", "R", "P") # Built in this order, KPK needs the other two for its promotions
+FILE_NAMES = {"Q": "kqk.bb", "R": "krk.bb", "P": "kpk.bb"}
+# Positions are indexed as if the piece side were White: White King square * 4096 + Black King square * 64 +
+# piece square, squares are row * 8 + col like GameState.board. Bit i of table 0 (White to move) or table 1
+# (Black to move) is set if White wins
+POSITIONS = 64 * 64 * 64
+TABLE_BYTES = POSITIONS // 8
+FILE_BYTES = 2 * TABLE_BYTES
+
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def onBoard(row, col):
+    return 0 <= row < 8 and 0 <= col < 8
+
+
+# Square geometry, built once
+KING_TARGETS = [[(sq // 8 + dr) * 8 + sq % 8 + dc for dr, dc in KING_OFFSETS if onBoard(sq // 8 + dr, sq % 8 + dc)]
+                for sq in range(64)]
+ADJACENT = [max(abs(a // 8 - b // 8), abs(a % 8 - b % 8)) <= 1 for a in range(64) for b in range(64)] # [a * 64 + b]
+# RAYS[sq][d]: squares from sq outwards in KING_OFFSETS[d]
+RAYS = [[[(sq // 8 + dr * i) * 8 + sq % 8 + dc * i for i in range(1, 8) if onBoard(sq // 8 + dr * i, sq % 8 + dc * i)]
+         for dr, dc in KING_OFFSETS] for sq in range(64)]
+ROOK_RAYS = (1, 3, 4, 6) # Indexes of the straight directions in KING_OFFSETS
+
+
+def _lineMasks(directions):
+    # [a * 64 + b]: bitmask of the squares strictly between a and b if a slider can go from one to the other, else -1
+    masks = [-1] * 4096
+    for a in range(64):
+        for d in directions:
+            between = 0
+            for b in RAYS[a][d]:
+                masks[a * 64 + b] = between
+                between |= 1 << b
+    return masks
+
+
+LINES = {"Q": _lineMasks(range(8)), "R": _lineMasks(ROOK_RAYS)}
+# White pawn on a attacks b
+PAWN_ATTACKS = [b // 8 == a // 8 - 1 and abs(b % 8 - a % 8) == 1 for a in range(64) for b in range(64)]
+
+
+'''
+Does White's piece (pieceType) on square piece attack target, with the White King on blocker in the way or not
+'''
+def pieceAttacks(pieceType, piece, target, blocker):
+    if pieceType == "P":
+        return PAWN_ATTACKS[piece * 64 + target]
+    between = LINES[pieceType][piece * 64 + target]
+    return between >= 0 and not between >> blocker & 1
+
+
+'''
+Three different squares, Kings not touching, pawn not on the first or last rank. Says nothing about checks
+'''
+def isPlacement(pieceType, whiteKing, blackKing, piece):
+    if whiteKing == blackKing or whiteKing == piece or blackKing == piece or ADJACENT[whiteKing * 64 + blackKing]:
+        return False
+    return pieceType != "P" or 1 <= piece // 8 <= 6
+
+
+'''
+Retrograde analysis in pure Python. Returns (whiteToMoveWins, blackToMoveWins) as bytearrays of POSITIONS flags.
+promotionWins (KPK only) flags the Black to move positions where a new Queen or Rook wins, by the same index.
+Works backwards from each new result with unmoves: a Black to move position is won once every Black move
+leads to a won position, so each keeps a count of the moves not yet shown to lose
+'''
+def generatePython(pieceType, promotionWins=None):
+    whiteWins = bytearray(POSITIONS)
+    blackWins = bytearray(POSITIONS)
+    remaining = bytearray(POSITIONS) # Black to move: legal moves not known to lose yet
+    whiteQueue = [] # New White to move wins, their Black predecessors still to update
+    blackQueue = [] # New Black to move wins, their White predecessors still to mark
+    for index in range(POSITIONS):
+        whiteKing = index >> 12
+        blackKing = index >> 6 & 63
+        piece = index & 63
+        if not isPlacement(pieceType, whiteKing, blackKing, piece):
+            continue
+        moves = 0
+        canCapture = False
+        for target in KING_TARGETS[blackKing]:
+            if target == whiteKing or ADJACENT[target * 64 + whiteKing]:
+                continue
+            if target == piece: # Not next to the White King, so the piece is lost and it's a draw
+                canCapture = True
+            elif not pieceAttacks(pieceType, piece, target, whiteKing):
+                moves += 1
+        inCheck = pieceAttacks(pieceType, piece, blackKing, whiteKing)
+        if canCapture:
+            remaining[index] = 255 # Never counts down to 0
+        elif moves:
+            remaining[index] = moves
+        elif inCheck: # Mate
+            blackWins[index] = 1
+            blackQueue.append(index)
+        # Promotions lead out of this table, straight to a KQK/KRK result
+        if pieceType == "P" and not inCheck and piece // 8 == 1 and piece - 8 != whiteKing and \
+                piece - 8 != blackKing and promotionWins[index - 8]:
+            whiteWins[index] = 1
+            whiteQueue.append(index)
+
+    while whiteQueue or blackQueue:
+        while blackQueue: # White to move positions with a move into this one are won
+            index = blackQueue.pop()
+            whiteKing = index >> 12
+            blackKing = index >> 6 & 63
+            piece = index & 63
+            base = index & ~63
+            predecessors = []
+            for origin in KING_TARGETS[whiteKing]:
+                if origin != blackKing and origin != piece and not ADJACENT[origin * 64 + blackKing]:
+                    predecessors.append(origin << 12 | blackKing << 6 | piece)
+            if pieceType == "P":
+                origin = piece + 8
+                if piece // 8 <= 5 and origin != whiteKing and origin != blackKing:
+                    predecessors.append(base | origin)
+                    origin = piece + 16
+                    if piece // 8 == 4 and origin != whiteKing and origin != blackKing:
+                        predecessors.append(base | origin)
+            else:
+                for d in (range(8) if pieceType == "Q" else ROOK_RAYS):
+                    for origin in RAYS[piece][d]:
+                        if origin == whiteKing or origin == blackKing:
+                            break
+                        predecessors.append(base | origin)
+            for predecessor in predecessors:
+                # Black can't be in check with White to move
+                if not whiteWins[predecessor] and \
+                        not pieceAttacks(pieceType, predecessor & 63, blackKing, predecessor >> 12):
+                    whiteWins[predecessor] = 1
+                    whiteQueue.append(predecessor)
+        while whiteQueue: # One more Black move known to lose for the Black to move positions leading here
+            index = whiteQueue.pop()
+            whiteKing = index >> 12
+            blackKing = index >> 6 & 63
+            piece = index & 63
+            for origin in KING_TARGETS[blackKing]:
+                if origin == whiteKing or origin == piece or ADJACENT[origin * 64 + whiteKing]:
+                    continue
+                predecessor = whiteKing << 12 | origin << 6 | piece
+                if remaining[predecessor]:
+                    remaining[predecessor] -= 1
+                    if remaining[predecessor] == 0:
+                        blackWins[predecessor] = 1
+                        blackQueue.append(predecessor)
+    return whiteWins, blackWins
+
+
+'''
+The same result with NumPy: every position's successors go in one index array per side (padded with sentinels),
+then whole-table sweeps (White to move: any move wins, Black to move: every move loses) run until nothing changes
+'''
+def generateNumpy(pieceType, promotionWins=None):
+    index = np.arange(POSITIONS, dtype=np.int32)
+    whiteKing = index >> 12
+    blackKing = index >> 6 & 63
+    piece = index & 63
+    adjacent = np.array(ADJACENT, dtype=bool)
+    kingTargets = np.full((64, 8), -1, dtype=np.int32)
+    for sq in range(64):
+        kingTargets[sq, :len(KING_TARGETS[sq])] = KING_TARGETS[sq]
+    if pieceType == "P":
+        pawnAttacks = np.array(PAWN_ATTACKS, dtype=bool)
+
+        def attacks(pieces, targets, blockers):
+            return pawnAttacks[pieces * 64 + targets]
+    else:
+        # blocked[a * 64 + b, sq]: sq is between a and b; aligned[a * 64 + b]: a slider goes from a to b
+        lines = LINES[pieceType]
+        aligned = np.array([mask >= 0 for mask in lines], dtype=bool)
+        blocked = np.array([[mask >= 0 and mask >> sq & 1 == 1 for sq in range(64)] for mask in lines], dtype=bool)
+
+        def attacks(pieces, targets, blockers):
+            pair = pieces * 64 + targets
+            return aligned[pair] & ~blocked[pair, blockers]
+
+    placement = (whiteKing != blackKing) & (whiteKing != piece) & (blackKing != piece) & \
+        ~adjacent[whiteKing * 64 + blackKing]
+    if pieceType == "P":
+        placement &= (piece >> 3 >= 1) & (piece >> 3 <= 6)
+    inCheck = placement & attacks(piece, blackKing, whiteKing)
+    whiteLegal = placement & ~inCheck
+    noMove = POSITIONS # Sentinel successors: padding, then (Black only) capturing the piece
+    capture = POSITIONS + 1
+
+    # Black to move
+    blackSuccessors = []
+    blackHasMove = np.zeros(POSITIONS, dtype=bool)
+    for d in range(8):
+        targets = kingTargets[blackKing, d]
+        valid = placement & (targets >= 0)
+        targets = np.where(valid, targets, 0)
+        valid &= (targets != whiteKing) & ~adjacent[targets * 64 + whiteKing]
+        captures = valid & (targets == piece)
+        moves = valid & (targets != piece) & ~attacks(piece, targets, whiteKing)
+        blackHasMove |= captures | moves
+        blackSuccessors.append(np.where(moves, (whiteKing << 12) | (targets << 6) | piece,
+                                        np.where(captures, capture, noMove)))
+    blackSuccessors = np.stack(blackSuccessors, axis=1)
+
+    # White to move
+    whiteSuccessors = []
+    for d in range(8):
+        targets = kingTargets[whiteKing, d]
+        valid = whiteLegal & (targets >= 0)
+        targets = np.where(valid, targets, 0)
+        valid &= (targets != blackKing) & (targets != piece) & ~adjacent[targets * 64 + blackKing]
+        whiteSuccessors.append(np.where(valid, (targets << 12) | (blackKing << 6) | piece, noMove))
+    base = (whiteKing << 12) | (blackKing << 6)
+    seeds = np.zeros(POSITIONS, dtype=bool)
+    if pieceType == "P":
+        push = piece - 8
+        empty = (push != whiteKing) & (push != blackKing)
+        single = whiteLegal & (piece >> 3 >= 2) & empty
+        whiteSuccessors.append(np.where(single, base | push, noMove))
+        double = single & (piece >> 3 == 6) & (piece - 16 != whiteKing) & (piece - 16 != blackKing)
+        whiteSuccessors.append(np.where(double, base | (piece - 16), noMove))
+        promotes = whiteLegal & (piece >> 3 == 1) & empty
+        seeds = promotes & promotionWins[np.where(promotes, index - 8, 0)]
+    else:
+        rays = np.full((64, 8, 7), -1, dtype=np.int32)
+        for sq in range(64):
+            for d in range(8):
+                rays[sq, d, :len(RAYS[sq][d])] = RAYS[sq][d]
+        for d in (range(8) if pieceType == "Q" else ROOK_RAYS):
+            reachable = whiteLegal
+            for step in range(7):
+                targets = rays[piece, d, step]
+                reachable = reachable & (targets >= 0) & (targets != whiteKing) & (targets != blackKing)
+                whiteSuccessors.append(np.where(reachable, base | np.where(reachable, targets, 0), noMove))
+    whiteSuccessors = np.stack(whiteSuccessors, axis=1)
+
+    whiteWins = seeds.copy()
+    blackWins = np.zeros(POSITIONS, dtype=bool)
+    while True:
+        # Padding counts as no win for "any move wins"
+        newWhiteWins = seeds | np.append(blackWins, False)[whiteSuccessors].any(axis=1)
+        newWhiteWins &= whiteLegal
+        # Padding counts as a loss for "every move loses", a capture as a draw. No moves at all: mate or stalemate
+        newBlackWins = np.append(newWhiteWins, (True, False))[blackSuccessors].all(axis=1) & \
+            (blackHasMove | inCheck) & placement
+        if np.array_equal(newWhiteWins, whiteWins) and np.array_equal(newBlackWins, blackWins):
+            return whiteWins, blackWins
+        whiteWins = newWhiteWins
+        blackWins = newBlackWins
+
+
+'''
+Win flags (White to move, Black to move) for pieceType, with NumPy if it's there
+'''
+def generate(pieceType, promotionWins=None):
+    if np is not None:
+        return generateNumpy(pieceType, promotionWins)
+    return generatePython(pieceType, promotionWins)
+
+
+def packBits(flags):
+    if np is not None:
+        return np.packbits(np.asarray(flags, dtype=bool), bitorder="little").tobytes()
+    packed = bytearray(len(flags) // 8)
+    for i in range(len(flags)):
+        if flags[i]:
+            packed[i >> 3] |= 1 << (i & 7)
+    return bytes(packed)
+
+
+def writeBitbase(path, whiteWins, blackWins):
+    with open(path, "wb") as out:
+        out.write(packBits(whiteWins))
+        out.write(packBits(blackWins))
+
+
+'''
+Generate KQK, KRK and KPK and write them to directory. report(message) is told about each one as it's done
+'''
+def buildBitbases(directory=BITBASE_DIR, report=None):
+    os.makedirs(directory, exist_ok=True)
+    blackWins = {}
+    for pieceType in PIECE_TYPES:
+        startTime = time.perf_counter()
+        promotionWins = None
+        if pieceType == "P": # Under-promoting to a Rook wins a few positions where a Queen stalemates
+            if np is not None:
+                promotionWins = blackWins["Q"] | blackWins["R"]
+            else:
+                promotionWins = bytearray(q | r for q, r in zip(blackWins["Q"], blackWins["R"]))
+        whiteWins, blackWins[pieceType] = generate(pieceType, promotionWins)
+        path = os.path.join(directory, FILE_NAMES[pieceType])
+        writeBitbase(path, whiteWins, blackWins[pieceType])
+        if report is not None:
+            report("%s: %d White to move and %d Black to move wins, %.1fs" %
+                   (path, sum(whiteWins), sum(blackWins[pieceType]), time.perf_counter() - startTime))
+
+
+class Bitbases:
+    '''
+    Opens whichever of the bitbase files are in directory
+    '''
+    def __init__(self, directory=BITBASE_DIR):
+        self.files = []
+        self.tables = {} # Piece type -> memory mapped file
+        for pieceType in PIECE_TYPES:
+            path = os.path.join(directory, FILE_NAMES[pieceType])
+            if not os.path.exists(path):
+                continue
+            file = open(path, "rb")
+            self.files.append(file)
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(data) != FILE_BYTES:
+                data.close()
+                self.close()
+                raise ValueError("%s isn't a bitbase, it has %d bytes instead of %d" % (path, len(data), FILE_BYTES))
+            self.tables[pieceType] = data
+
+    '''
+    Result for the side to move: 1 win, 0 draw, -1 loss. None if the position isn't King and one Queen, Rook or
+    pawn against a lone King, or that table isn't loaded
+    '''
+    def probe(self, gameState):
+        if gameState.pieceCount != 3:
+            return None
+        piece = None
+        for row in range(8):
+            for col in range(8):
+                square = gameState.board[row][col]
+                if square != "--" and square[1] != 'K':
+                    piece = square
+                    pieceRow, pieceCol = row, col
+        if piece is None or piece[1] not in self.tables:
+            return None
+        if piece[0] == 'w':
+            whiteKing = gameState.whiteKingLocation[0] * 8 + gameState.whiteKingLocation[1]
+            blackKing = gameState.blackKingLocation[0] * 8 + gameState.blackKingLocation[1]
+            square = pieceRow * 8 + pieceCol
+            strongToMove = gameState.whiteToMove
+        else: # Flip the board so the piece side is White
+            whiteKing = (7 - gameState.blackKingLocation[0]) * 8 + gameState.blackKingLocation[1]
+            blackKing = (7 - gameState.whiteKingLocation[0]) * 8 + gameState.whiteKingLocation[1]
+            square = (7 - pieceRow) * 8 + pieceCol
+            strongToMove = not gameState.whiteToMove
+        index = whiteKing << 12 | blackKing << 6 | square
+        offset = (0 if strongToMove else TABLE_BYTES) + (index >> 3)
+        if not self.tables[piece[1]][offset] >> (index & 7) & 1:
+            return 0
+        return 1 if strongToMove else -1
+
+    def close(self):
+        for data in self.tables.values():
+            data.close()
+        self.tables = {}
+        for file in self.files:
+            file.close()
+        self.files = []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe the KQK, KRK and KPK bitbases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Generate the bitbases")
+    build.add_argument("-o", "--output", default=BITBASE_DIR, help="Directory to write to (default %s)" % BITBASE_DIR)
+    probe = commands.add_parser("probe", help="Look up a position")
+    probe.add_argument("--dir", default=BITBASE_DIR, help="Bitbase directory (default %s)" % BITBASE_DIR)
+    probe.add_argument("--fen", required=True, help="Position to look up")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if np is None:
+            print("NumPy isn't installed, using the slower pure Python generator", flush=True)
+        buildBitbases(args.output, report=lambda message: print(message, flush=True))
+        return 0
+
+    bitbases = Bitbases(args.dir)
+    try:
+        result = bitbases.probe(ChessEngine.GameState.fromFen(args.fen))
+    finally:
+        bitbases.close()
+    print({None: "Not in the bitbases", 1: "Win for the side to move", 0: "Draw",
+           -1: "Loss for the side to move"}[result])
+    return 0 if result is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
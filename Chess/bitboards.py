@@ -0,0 +1,359 @@
+"""
+- Bitboard backed GameState, selected with ChessEngine.GameState(useBitboards=True)
+- Keeps twelve 64-bit piece sets plus occupancy masks next to the 8x8 board
+- Generates the same Move objects as ChessEngine.GameState.getValidMoves, just without walking the board
+"""
+
+from Chess import ChessEngine
+
+# Square index = row * 8 + col, so bit 0 is a8 and bit 63 is h1 (same orientation as GameState.board)
+WHITE = 0
+BLACK = 1
+PIECES = ['wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK']
+PIECE_INDEX = {piece: i for i, piece in enumerate(PIECES)}
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+FULL = (1 << 64) - 1
+
+# (row, col) tuples built once so the generator never allocates a coordinate
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)]
+
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def bitIndex(bb):
+    # Index of the lowest set bit
+    return (bb & -bb).bit_length() - 1
+
+
+def popCount(bb):
+    return bin(bb).count('1')
+
+
+def _stepAttacks(offsets):
+    table = []
+    for row, col in SQUARES:
+        attacks = 0
+        for dRow, dCol in offsets:
+            if 0 <= row + dRow < 8 and 0 <= col + dCol < 8:
+                attacks |= 1 << ((row + dRow) * 8 + col + dCol)
+        table.append(attacks)
+    return table
+
+
+def _slidingAttacks(sq, occupied, directions):
+    row, col = SQUARES[sq]
+    attacks = 0
+    for dRow, dCol in directions:
+        endRow, endCol = row + dRow, col + dCol
+        while 0 <= endRow < 8 and 0 <= endCol < 8:
+            bit = 1 << (endRow * 8 + endCol)
+            attacks |= bit
+            if occupied & bit: # Blocked, but the blocker itself is attacked
+                break
+            endRow += dRow
+            endCol += dCol
+    return attacks
+
+
+def _relevantMask(sq, directions):
+    # The squares whose occupancy can change the attack set (edges never block anything further)
+    row, col = SQUARES[sq]
+    mask = 0
+    for dRow, dCol in directions:
+        endRow, endCol = row + dRow, col + dCol
+        while 0 <= endRow + dRow < 8 and 0 <= endCol + dCol < 8:
+            mask |= 1 << (endRow * 8 + endCol)
+            endRow += dRow
+            endCol += dCol
+    return mask
+
+
+def _attackTable(directions):
+    # Per square: relevant mask, and a dict from every masked occupancy to its attack set
+    masks = []
+    tables = []
+    for sq in range(64):
+        mask = _relevantMask(sq, directions)
+        table = {}
+        subset = 0
+        while True: # Enumerate every subset of the mask (carry-rippler)
+            table[subset] = _slidingAttacks(sq, subset, directions)
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+KNIGHT_ATTACKS = _stepAttacks(KNIGHT_OFFSETS)
+KING_ATTACKS = _stepAttacks(KING_OFFSETS)
+PAWN_ATTACKS = (_stepAttacks(((-1, -1), (-1, 1))), _stepAttacks(((1, -1), (1, 1)))) # Squares a pawn attacks, by color
+ROOK_MASKS, ROOK_TABLES = _attackTable(ROOK_DIRECTIONS)
+BISHOP_MASKS, BISHOP_TABLES = _attackTable(BISHOP_DIRECTIONS)
+ROOK_RAYS = [_slidingAttacks(sq, 0, ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_RAYS = [_slidingAttacks(sq, 0, BISHOP_DIRECTIONS) for sq in range(64)]
+
+
+def _betweenTable():
+    # Squares strictly between two aligned squares, 0 if they don't share a line
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        row, col = SQUARES[sq]
+        for dRow, dCol in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            between = 0
+            endRow, endCol = row + dRow, col + dCol
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                table[sq][endRow * 8 + endCol] = between
+                between |= 1 << (endRow * 8 + endCol)
+                endRow += dRow
+                endCol += dCol
+    return table
+
+
+BETWEEN = _betweenTable()
+
+
+def rookAttacks(sq, occupied):
+    return ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+
+
+def bishopAttacks(sq, occupied):
+    return BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+
+
+class BitboardGameState(ChessEngine.GameState):
+    def __init__(self, useBitboards=True):
+        super().__init__()
+        self.loadBitboards()
+
+    '''
+    Rebuild every bitboard from self.board
+    '''
+    def loadBitboards(self):
+        self.pieceBoards = [0] * 12
+        self.occupancy = [0, 0] # White pieces, Black pieces
+        for sq, (row, col) in enumerate(SQUARES):
+            piece = self.board[row][col]
+            if piece != "--":
+                self.pieceBoards[PIECE_INDEX[piece]] |= 1 << sq
+                self.occupancy[WHITE if piece[0] == 'w' else BLACK] |= 1 << sq
+        self.allOccupancy = self.occupancy[WHITE] | self.occupancy[BLACK]
+
+    def loadFen(self, fen):
+        super().loadFen(fen)
+        self.loadBitboards()
+
+    def makeMove(self, move):
+        super().makeMove(move)
+        # The board already holds the promoted piece, if any
+        self.toggleMove(move, self.board[move.endRow][move.endCol])
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            placedPiece = self.board[move.endRow][move.endCol]
+            super().undoMove()
+            self.toggleMove(move, placedPiece)
+
+    '''
+    XOR a move in or out of the bitboards, so the same call makes and unmakes it
+    '''
+    def toggleMove(self, move, placedPiece):
+        side = WHITE if move.pieceMoved[0] == 'w' else BLACK
+        startBit = 1 << (move.startRow * 8 + move.startCol)
+        endBit = 1 << (move.endRow * 8 + move.endCol)
+        self.pieceBoards[PIECE_INDEX[move.pieceMoved]] ^= startBit
+        self.pieceBoards[PIECE_INDEX[placedPiece]] ^= endBit
+        self.occupancy[side] ^= startBit | endBit
+        if move.isCapture:
+            if move.isEnPassantMove:
+                captureBit = 1 << (move.startRow * 8 + move.endCol)
+            else:
+                captureBit = endBit
+            self.pieceBoards[PIECE_INDEX[move.pieceCaptured]] ^= captureBit
+            self.occupancy[1 - side] ^= captureBit
+        if move.isCastleMove:
+            rowBase = move.endRow * 8
+            if move.endCol - move.startCol == 2: # King Side
+                rookBits = (1 << (rowBase + 7)) | (1 << (rowBase + 5))
+            else: # Queen Side
+                rookBits = (1 << rowBase) | (1 << (rowBase + 3))
+            self.pieceBoards[side * 6 + ROOK] ^= rookBits
+            self.occupancy[side] ^= rookBits
+        self.allOccupancy = self.occupancy[WHITE] | self.occupancy[BLACK]
+
+    '''
+    Bitboard of the pieces of "side" that attack sq, given the occupancy "occupied"
+    '''
+    def attackersTo(self, sq, occupied, side):
+        pieceBoards = self.pieceBoards
+        base = side * 6
+        queens = pieceBoards[base + QUEEN]
+        return ((PAWN_ATTACKS[1 - side][sq] & pieceBoards[base + PAWN]) |
+                (KNIGHT_ATTACKS[sq] & pieceBoards[base + KNIGHT]) |
+                (KING_ATTACKS[sq] & pieceBoards[base + KING]) |
+                (bishopAttacks(sq, occupied) & (pieceBoards[base + BISHOP] | queens)) |
+                (rookAttacks(sq, occupied) & (pieceBoards[base + ROOK] | queens)))
+
+    def squareUnderAttack(self, row, col):
+        enemy = BLACK if self.whiteToMove else WHITE
+        return self.attackersTo(row * 8 + col, self.allOccupancy, enemy) != 0
+
+    def hasNonPawnMaterial(self, white):
+        pieceBoards = self.pieceBoards
+        base = (WHITE if white else BLACK) * 6
+        return (pieceBoards[base + KNIGHT] | pieceBoards[base + BISHOP] | pieceBoards[base + ROOK] |
+                pieceBoards[base + QUEEN]) != 0
+
+    '''
+    Same contract as GameState.getValidMoves: returns the legal moves and sets inCheck, checkmate and stalemate
+    '''
+    def getValidMoves(self):
+        moves = []
+        board = self.board
+        pieceBoards = self.pieceBoards
+        us = WHITE if self.whiteToMove else BLACK
+        them = 1 - us
+        base = us * 6
+        enemyBase = them * 6
+        own = self.occupancy[us]
+        occupied = self.allOccupancy
+        notOwn = ~own & FULL
+        kingBit = pieceBoards[base + KING]
+        kingSq = bitIndex(kingBit)
+        kingSquare = SQUARES[kingSq]
+        checkers = self.attackersTo(kingSq, occupied, them)
+        self.inCheck = checkers != 0
+
+        # Pinned pieces may only move along the line between the King and the pinning piece
+        pinned = {}
+        enemyQueens = pieceBoards[enemyBase + QUEEN]
+        snipers = ((ROOK_RAYS[kingSq] & (pieceBoards[enemyBase + ROOK] | enemyQueens)) |
+                   (BISHOP_RAYS[kingSq] & (pieceBoards[enemyBase + BISHOP] | enemyQueens)))
+        while snipers:
+            sniperBit = snipers & -snipers
+            snipers ^= sniperBit
+            sniperSq = sniperBit.bit_length() - 1
+            blockers = BETWEEN[kingSq][sniperSq] & occupied
+            if blockers and blockers & (blockers - 1) == 0 and blockers & own: # Exactly one piece, and it's ours
+                pinned[bitIndex(blockers)] = BETWEEN[kingSq][sniperSq] | sniperBit
+
+        # King moves, with the King taken off the board so it can't hide behind itself
+        occupiedNoKing = occupied ^ kingBit
+        targets = KING_ATTACKS[kingSq] & notOwn
+        while targets:
+            targetBit = targets & -targets
+            targets ^= targetBit
+            targetSq = targetBit.bit_length() - 1
+            if not self.attackersTo(targetSq, occupiedNoKing, them):
+                moves.append(ChessEngine.Move(kingSquare, SQUARES[targetSq], board))
+
+        if checkers & (checkers - 1) == 0: # Not a double check, so other pieces can move
+            if checkers:
+                # Must capture the checking piece or block the line to it
+                checkMask = BETWEEN[kingSq][bitIndex(checkers)] | checkers
+            else:
+                checkMask = FULL
+            self.getPawnBitboardMoves(us, pinned, checkMask, moves)
+            self.getPieceBitboardMoves(pieceBoards[base + KNIGHT], KNIGHT, pinned, notOwn & checkMask, moves)
+            self.getPieceBitboardMoves(pieceBoards[base + BISHOP], BISHOP, pinned, notOwn & checkMask, moves)
+            self.getPieceBitboardMoves(pieceBoards[base + ROOK], ROOK, pinned, notOwn & checkMask, moves)
+            self.getPieceBitboardMoves(pieceBoards[base + QUEEN], QUEEN, pinned, notOwn & checkMask, moves)
+            if not checkers:
+                self.getCastleBitboardMoves(us, kingSq, moves)
+
+        if len(moves) == 0:
+            if self.inCheck:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        return moves
+
+    def getPieceBitboardMoves(self, pieces, pieceType, pinned, allowed, moves):
+        board = self.board
+        occupied = self.allOccupancy
+        while pieces:
+            pieceBit = pieces & -pieces
+            pieces ^= pieceBit
+            sq = pieceBit.bit_length() - 1
+            if pieceType == KNIGHT:
+                if sq in pinned: # A pinned Knight can never move
+                    continue
+                targets = KNIGHT_ATTACKS[sq]
+            elif pieceType == BISHOP:
+                targets = bishopAttacks(sq, occupied)
+            elif pieceType == ROOK:
+                targets = rookAttacks(sq, occupied)
+            else:
+                targets = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+            targets &= allowed & pinned.get(sq, FULL)
+            startSquare = SQUARES[sq]
+            while targets:
+                targetBit = targets & -targets
+                targets ^= targetBit
+                moves.append(ChessEngine.Move(startSquare, SQUARES[targetBit.bit_length() - 1], board))
+
+    def getPawnBitboardMoves(self, us, pinned, checkMask, moves):
+        board = self.board
+        occupied = self.allOccupancy
+        enemies = self.occupancy[1 - us]
+        forward = -8 if us == WHITE else 8
+        startRow = 6 if us == WHITE else 1
+        lastRow = 1 if us == WHITE else 6 # Pawns that promote on their next move
+        if self.enPassantPossible:
+            enPassantSq = self.enPassantPossible[0] * 8 + self.enPassantPossible[1]
+        else:
+            enPassantSq = -1
+        pawns = self.pieceBoards[us * 6 + PAWN]
+        while pawns:
+            pawnBit = pawns & -pawns
+            pawns ^= pawnBit
+            sq = pawnBit.bit_length() - 1
+            startSquare = SQUARES[sq]
+            promotionRow = startSquare[0] == lastRow # Every move of this pawn promotes
+            allowed = checkMask & pinned.get(sq, FULL)
+            oneStep = sq + forward
+            if not (occupied >> oneStep) & 1: # 1 Square Move
+                if (allowed >> oneStep) & 1:
+                    self.addPawnMove(startSquare, SQUARES[oneStep], promotionRow, moves)
+                twoStep = oneStep + forward
+                if startSquare[0] == startRow and not (occupied >> twoStep) & 1 and (allowed >> twoStep) & 1:
+                    moves.append(ChessEngine.Move(startSquare, SQUARES[twoStep], board))
+            targets = PAWN_ATTACKS[us][sq] & enemies & allowed
+            while targets:
+                targetBit = targets & -targets
+                targets ^= targetBit
+                self.addPawnMove(startSquare, SQUARES[targetBit.bit_length() - 1], promotionRow, moves)
+            if enPassantSq >= 0 and (PAWN_ATTACKS[us][sq] >> enPassantSq) & 1:
+                if self.isLegalEnPassant(us, sq, enPassantSq):
+                    moves.append(ChessEngine.Move(startSquare, SQUARES[enPassantSq], board, enPassant=True))
+
+    '''
+    En passant removes two pieces from one line, so just play it out on the occupancy and look at the King
+    '''
+    def isLegalEnPassant(self, us, sq, enPassantSq):
+        capturedBit = 1 << (enPassantSq - (-8 if us == WHITE else 8))
+        occupied = (self.allOccupancy ^ (1 << sq) ^ capturedBit) | (1 << enPassantSq)
+        kingSq = bitIndex(self.pieceBoards[us * 6 + KING])
+        return not self.attackersTo(kingSq, occupied, 1 - us) & ~capturedBit
+
+    def getCastleBitboardMoves(self, us, kingSq, moves):
+        rights = self.castlingRights
+        if us == WHITE:
+            kingSide = rights & ChessEngine.WHITE_KING_SIDE
+            queenSide = rights & ChessEngine.WHITE_QUEEN_SIDE
+        else:
+            kingSide = rights & ChessEngine.BLACK_KING_SIDE
+            queenSide = rights & ChessEngine.BLACK_QUEEN_SIDE
+        occupied = self.allOccupancy
+        them = 1 - us
+        if kingSide and not occupied & ((1 << (kingSq + 1)) | (1 << (kingSq + 2))):
+            if not self.attackersTo(kingSq + 1, occupied, them) and not self.attackersTo(kingSq + 2, occupied, them):
+                moves.append(ChessEngine.Move(SQUARES[kingSq], SQUARES[kingSq + 2], self.board, isCastleMove=True))
+        if queenSide and not occupied & ((1 << (kingSq - 1)) | (1 << (kingSq - 2)) | (1 << (kingSq - 3))):
+            if not self.attackersTo(kingSq - 1, occupied, them) and not self.attackersTo(kingSq - 2, occupied, them):
+                moves.append(ChessEngine.Move(SQUARES[kingSq], SQUARES[kingSq - 2], self.board, isCastleMove=True))
@@ -0,0 +1,197 @@
+"""
+- Opening book: 16 byte entries sorted by position key, the Polyglot .bin layout (key, move, weight, learn, big endian)
+- The keys are GameState.zobristKey, not Polyglot's own hash, so books have to be built with this module
+- The file is memory mapped and binary searched, so a probe reads a handful of entries instead of loading the book
+- python -m Chess.book build games.pgn -o book.bin --plies 20   build a book from the first 20 plies of each game
+- python -m Chess.book probe book.bin --fen "..."              list the book moves for a position
+"""
+
+import argparse
+import mmap
+import random
+import struct
+import sys
+
+from Chess import ChessEngine, pgn
+
+ENTRY = struct.Struct(">QHHI") # key, move, weight, learn
+BOOK_PLIES = 20 # Plies of each game that go into a built book
+MAX_WEIGHT = 0xFFFF
+PROMOTION_CODES = {'N': 1, 'B': 2, 'R': 3, 'Q': 4}
+
+
+'''
+Polyglot move code: to file, to rank, from file, from rank (3 bits each, rank 0 is White's back rank) and the
+promotion piece. Castling is written as the King taking its own Rook (e1h1, e1a1)
+'''
+def encodeMove(move):
+    endCol = move.endCol
+    if move.isCastleMove:
+        endCol = 7 if move.endCol > move.startCol else 0
+    code = endCol | (7 - move.endRow) << 3 | move.startCol << 6 | (7 - move.startRow) << 9
+    if move.pawnPromotion:
+        code |= PROMOTION_CODES[move.promotionChoice] << 12
+    return code
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.file.seek(0, 2)
+        self.count = self.file.tell() // ENTRY.size
+        # mmap can't map an empty file, an empty book just never has a move
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    '''
+    (move code, weight) for every entry of the position key, heaviest first as the builder writes them
+    '''
+    def getEntries(self, key):
+        entries = []
+        if not self.count:
+            return entries
+        data = self.data
+        low = 0
+        high = self.count
+        while low < high: # First entry with a key >= key
+            middle = (low + high) // 2
+            if ENTRY.unpack_from(data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        while low < self.count:
+            entryKey, code, weight, learn = ENTRY.unpack_from(data, low * ENTRY.size)
+            if entryKey != key:
+                break
+            entries.append((code, weight))
+            low += 1
+        return entries
+
+    '''
+    A legal book move for gameState picked at random in proportion to its weight, or None if the position isn't
+    in the book. validMoves are gameState's legal moves (generated if not given)
+    '''
+    def getMove(self, gameState, validMoves=None):
+        entries = self.getEntries(gameState.zobristKey)
+        if not entries:
+            return None
+        if validMoves is None:
+            validMoves = gameState.getValidMoves()
+        movesByCode = {encodeMove(move): move for move in validMoves}
+        # An entry that isn't legal here can only be a hash collision, leave it out
+        choices = [(movesByCode[code], weight) for code, weight in entries if code in movesByCode]
+        if not choices:
+            return None
+        total = sum(weight for move, weight in choices)
+        if total == 0: # Only moves that never scored, still better than leaving the book early
+            return random.choice(choices)[0]
+        pick = random.randint(1, total)
+        for move, weight in choices:
+            pick -= weight
+            if pick <= 0:
+                return move
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+
+'''
+Collect book entries from PgnGames: {key: {move code: [weight, games]}}. A move's weight is the points the side
+that played it scored, 2 for a win and 1 for a draw (unfinished games count as draws). Games with a move that
+can't be read are used up to that move
+'''
+def collectEntries(games, maxPlies=BOOK_PLIES):
+    positions = {}
+    moverPoints = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1), "*": (1, 1)}
+    for game in games:
+        whitePoints, blackPoints = moverPoints.get(game.result, (1, 1))
+        try:
+            gameState = ChessEngine.GameState.fromFen(game.getStartFen(), useBitboards=True)
+        except (ValueError, KeyError, IndexError):
+            continue
+        for san in game.moves[:maxPlies]:
+            try:
+                move = pgn.parseSan(gameState, san)
+            except ValueError:
+                break
+            moves = positions.setdefault(gameState.zobristKey, {})
+            entry = moves.setdefault(encodeMove(move), [0, 0])
+            entry[0] += whitePoints if gameState.whiteToMove else blackPoints
+            entry[1] += 1
+            gameState.makeMove(move)
+    return positions
+
+
+'''
+Write the entries to path, sorted by key then heaviest move first. Moves seen in fewer than minGames games are
+dropped, and each position's weights are scaled down if needed to fit in 16 bits. Returns the number of entries
+'''
+def writeBook(path, positions, minGames=1):
+    records = []
+    for key, moves in positions.items():
+        moves = [(code, weight) for code, (weight, games) in moves.items() if games >= minGames]
+        if not moves:
+            continue
+        heaviest = max(weight for code, weight in moves)
+        for code, weight in moves:
+            if heaviest > MAX_WEIGHT:
+                weight = max(1, weight * MAX_WEIGHT // heaviest) if weight else 0
+            records.append((key, -weight, code))
+    records.sort()
+    with open(path, "wb") as out:
+        for key, weight, code in records:
+            out.write(ENTRY.pack(key, code, -weight, 0))
+    return len(records)
+
+
+'''
+Build a book file from a PGN file
+'''
+def buildBook(pgnPath, bookPath, maxPlies=BOOK_PLIES, minGames=1):
+    with open(pgnPath) as lines:
+        positions = collectEntries(pgn.readGames(lines), maxPlies)
+    return writeBook(bookPath, positions, minGames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or look up an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build a book from a PGN file")
+    build.add_argument("pgn", help="PGN file of games to take the openings from")
+    build.add_argument("-o", "--output", default="book.bin", help="Book file to write (default book.bin)")
+    build.add_argument("--plies", type=int, default=BOOK_PLIES,
+                       help="Plies of each game to put in the book (default %d)" % BOOK_PLIES)
+    build.add_argument("--min-games", type=int, default=1, help="Leave out moves played in fewer games than this")
+    probe = commands.add_parser("probe", help="List the book moves for a position")
+    probe.add_argument("book", help="Book file")
+    probe.add_argument("--fen", default=ChessEngine.START_FEN, help="Position (default: the start position)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        entries = buildBook(args.pgn, args.output, args.plies, args.min_games)
+        print("Wrote %d entries to %s" % (entries, args.output))
+        return 0
+
+    gameState = ChessEngine.GameState.fromFen(args.fen, useBitboards=True)
+    validMoves = gameState.getValidMoves()
+    movesByCode = {encodeMove(move): move for move in validMoves}
+    book = OpeningBook(args.book)
+    try:
+        entries = book.getEntries(gameState.zobristKey)
+    finally:
+        book.close()
+    total = sum(weight for code, weight in entries)
+    for code, weight in entries:
+        move = movesByCode.get(code)
+        san = pgn.getSan(gameState, move, validMoves) if move is not None else "illegal move %d" % code
+        print("%-8s %6d %6.1f%%" % (san, weight, 100 * weight / max(total, 1)))
+    if not entries:
+        print("Not in the book")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+- Piece values and piece-square tables used to score a position
+- Precomputed per (piece, square) so GameState can keep the score up to date move by move
+"""
+
+# King score doesn't matter, because you can't technically capture the King
+pieceScores = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+
+knightScores = [
+    [1, 1, 1, 1, 1, 1, 1, 1],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [1, 1, 1, 1, 1, 1, 1, 1]
+]
+
+bishopScores = [
+    [4, 3, 2, 1, 1, 2, 3, 4],
+    [3, 4, 3, 2, 2, 3, 4, 3],
+    [2, 3, 4, 3, 3, 4, 3, 2],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [2, 3, 4, 3, 3, 4, 3, 1],
+    [3, 4, 3, 2, 2, 3, 4, 1],
+    [4, 3, 2, 1, 1, 2, 3, 1]
+]
+
+queenScores = [
+    [1, 1, 1, 3, 1, 1, 1, 1],
+    [1, 2, 3, 3, 3, 1, 1, 1],
+    [1, 4, 3, 3, 3, 4, 2, 1],
+    [1, 2, 3, 3, 3, 2, 2, 1],
+    [1, 2, 3, 3, 3, 2, 2, 1],
+    [1, 4, 3, 3, 3, 4, 2, 1],
+    [1, 2, 3, 3, 3, 1, 1, 1],
+    [1, 1, 1, 3, 1, 1, 1, 1]
+]
+
+rookScores = [
+    [4, 3, 4, 4, 4, 4, 3, 4],
+    [4, 4, 4, 4, 4, 4, 4, 4],
+    [1, 1, 2, 3, 3, 2, 1, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 1, 2, 3, 3, 2, 1, 1],
+    [4, 4, 4, 4, 4, 4, 4, 4],
+    [4, 3, 4, 4, 4, 4, 3, 4]
+]
+
+whitePawnScores = [
+    [9, 9, 9, 9, 9, 9, 9, 9],
+    [8, 8, 8, 8, 8, 8, 8, 8],
+    [5, 6, 6, 7, 7, 6, 6, 5],
+    [2, 3, 3, 5, 5, 3, 3, 2],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 1, 1, 0, 0, 1, 1, 1],
+    [0, 0, 0, 0, 0, 0, 0, 0]
+]
+
+blackPawnScores = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [1, 1, 1, 0, 0, 1, 1, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [2, 3, 3, 5, 5, 3, 3, 2],
+    [5, 6, 6, 7, 7, 6, 6, 5],
+    [8, 8, 8, 8, 8, 8, 8, 8],
+    [9, 9, 9, 9, 9, 9, 9, 9]
+]
+
+piecePositionScores = {"N": knightScores, "B": bishopScores, "Q": queenScores,
+                      "R": rookScores, "bP": blackPawnScores, "wP": whitePawnScores}
+
+# Signed values from White's point of view, indexed [piece][row * 8 + col]
+# The pawn tables stop at row 6, no pawn can stand on row 7 (White's back rank, Black's promotion rank)
+pieceMaterialValues = {}
+pieceSquareValues = {}
+for color, sign in (('w', 1), ('b', -1)):
+    for pieceType in pieceScores:
+        piece = color + pieceType
+        pieceMaterialValues[piece] = sign * pieceScores[pieceType]
+        if pieceType == 'K': # No position table for the King
+            table = [[0] * 8] * 8
+        elif pieceType == 'P':
+            table = piecePositionScores[piece]
+        else:
+            table = piecePositionScores[pieceType]
+        pieceSquareValues[piece] = [sign * table[row][col] if row < len(table) else 0
+                                    for row in range(8) for col in range(8)]
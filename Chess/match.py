@@ -0,0 +1,233 @@
+"""
+- Headless engine vs engine matches: plays games between two ChessAI.Searcher configurations, no display needed
+- Games run in parallel processes, each opening is played twice with the colors swapped
+- Reports wins/draws/losses for the first engine, the Elo difference with a 95% error bar, and nodes per second
+- python -m Chess.match -n 200 -t 0.1 --engine1 depth=4 --engine2 depth=3
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Chess import ChessAI, ChessEngine, pgn
+
+MAX_PLIES = 300 # Games still going after this many plies are scored as draws
+RANDOM_PLIES = 4 # Random moves played from the start position to make each opening pair different
+
+
+'''
+Searcher keyword arguments from strings like "depth=3", "ttSizeMB=8" or "bookFile=book.bin"
+'''
+def parseEngineConfig(options):
+    config = {}
+    for option in options or []:
+        name, value = option.split("=", 1)
+        if value.lower() in ("true", "false"):
+            config[name] = value.lower() == "true"
+        else:
+            try:
+                config[name] = int(value)
+            except ValueError:
+                try:
+                    config[name] = float(value)
+                except ValueError:
+                    config[name] = value
+    return config
+
+
+'''
+FEN for each opening: from the file (one FEN/EPD per line) if given, otherwise randomPlies random moves from the start
+'''
+def makeOpenings(count, randomPlies, seed, openingsFile=None):
+    if openingsFile is not None:
+        from Chess.analyze import readPositions
+        with open(openingsFile) as lines:
+            fens = [fen for index, fen, positionId in readPositions(lines)]
+        rng = random.Random(seed)
+        return [rng.choice(fens) for _ in range(count)]
+    openings = []
+    rng = random.Random(seed)
+    while len(openings) < count:
+        gameState = ChessEngine.GameState(useBitboards=True)
+        for _ in range(randomPlies):
+            validMoves = gameState.getValidMoves()
+            if not validMoves:
+                break
+            gameState.makeMove(rng.choice(validMoves))
+        if gameState.getValidMoves(): # Don't hand out finished games
+            openings.append(gameState.toFen())
+    return openings
+
+
+'''
+Runs in a pool process: one game from fen. Returns a dict with the result ("1-0", "0-1", "1/2-1/2"), why it ended,
+the moves, and nodes and search time for the White and Black engines
+'''
+def playGame(fen, whiteConfig, blackConfig, timeLimit, maxPlies=MAX_PLIES):
+    gameState = ChessEngine.GameState.fromFen(fen, useBitboards=True)
+    searchers = (ChessAI.Searcher(**whiteConfig), ChessAI.Searcher(**blackConfig))
+    nodes = [0, 0]
+    searchTime = [0.0, 0.0]
+    result = None
+    reason = None
+    while result is None:
+        validMoves = gameState.getValidMoves()
+        drawReason = gameState.getDrawReason()
+        if gameState.checkmate:
+            result = "0-1" if gameState.whiteToMove else "1-0"
+            reason = "checkmate"
+        elif gameState.stalemate:
+            result, reason = "1/2-1/2", "stalemate"
+        elif drawReason is not None:
+            result, reason = "1/2-1/2", drawReason
+        elif len(gameState.moveLog) >= maxPlies:
+            result, reason = "1/2-1/2", "move limit"
+        else:
+            side = 0 if gameState.whiteToMove else 1
+            searcher = searchers[side]
+            startTime = time.perf_counter()
+            move = searcher.findBestMove(gameState, validMoves, time_limit=timeLimit)
+            searchTime[side] += time.perf_counter() - startTime
+            nodes[side] += searcher.nodes
+            if move is None: # Every move loses, play one anyway
+                move = ChessAI.findRandomMove(validMoves)
+            gameState.makeMove(move)
+    for searcher in searchers:
+        searcher.close()
+    return {"fen": fen, "result": result, "reason": reason, "moves": gameState.moveLog,
+            "nodes": nodes, "time": searchTime}
+
+
+'''
+Elo difference for a score fraction, and the 95% error bar from the per game scores (0 +/- inf for no games)
+'''
+def eloDifference(scores):
+    games = len(scores)
+    if games == 0:
+        return 0, math.inf
+    mean = sum(scores) / games
+    if mean <= 0 or mean >= 1:
+        return (math.inf if mean >= 1 else -math.inf), math.inf
+    deviation = math.sqrt(sum((score - mean) ** 2 for score in scores) / games)
+    margin = 1.96 * deviation / math.sqrt(games)
+
+    def elo(fraction):
+        fraction = min(max(fraction, 1e-9), 1 - 1e-9)
+        return -400 * math.log10(1 / fraction - 1)
+
+    return elo(mean), (elo(mean + margin) - elo(mean - margin)) / 2
+
+
+'''
+Plays games (rounded up to an even number) between engine1 and engine2 and returns the summary dict.
+report(gameNumber, game, engine1White) is called as each game finishes
+'''
+def runMatch(games, engine1, engine2, timeLimit=None, workers=1, randomPlies=RANDOM_PLIES, seed=None,
+             openingsFile=None, maxPlies=MAX_PLIES, report=None):
+    pairs = (games + 1) // 2
+    openings = makeOpenings(pairs, randomPlies, seed, openingsFile)
+    tasks = []
+    for fen in openings: # Same opening with each engine as White
+        tasks.append((fen, True))
+        tasks.append((fen, False))
+
+    wins = draws = losses = 0
+    scores = []
+    nodes = [0, 0] # engine1, engine2
+    searchTime = [0.0, 0.0]
+    startTime = time.perf_counter()
+
+    def record(game, engine1White):
+        nonlocal wins, draws, losses
+        if game["result"] == "1/2-1/2":
+            draws += 1
+            scores.append(0.5)
+        elif (game["result"] == "1-0") == engine1White:
+            wins += 1
+            scores.append(1.0)
+        else:
+            losses += 1
+            scores.append(0.0)
+        first, second = (0, 1) if engine1White else (1, 0)
+        nodes[0] += game["nodes"][first]
+        nodes[1] += game["nodes"][second]
+        searchTime[0] += game["time"][first]
+        searchTime[1] += game["time"][second]
+        if report is not None:
+            report(len(scores), game, engine1White)
+
+    if workers <= 1:
+        for fen, engine1White in tasks:
+            white, black = (engine1, engine2) if engine1White else (engine2, engine1)
+            record(playGame(fen, white, black, timeLimit, maxPlies), engine1White)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for fen, engine1White in tasks:
+                white, black = (engine1, engine2) if engine1White else (engine2, engine1)
+                futures[pool.submit(playGame, fen, white, black, timeLimit, maxPlies)] = engine1White
+            for future in as_completed(futures):
+                record(future.result(), futures[future])
+
+    elo, errorBar = eloDifference(scores)
+    return {"games": len(scores), "wins": wins, "draws": draws, "losses": losses,
+            "score": sum(scores) / len(scores) if scores else 0.5, "elo": elo, "eloError": errorBar,
+            "nps": [nodes[i] / max(searchTime[i], 1e-9) for i in range(2)],
+            "elapsed": time.perf_counter() - startTime}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play games between two engine configurations")
+    parser.add_argument("-n", "--games", type=int, default=100, help="Number of games, played in color swapped pairs")
+    parser.add_argument("-t", "--time", type=float, help="Seconds per move (default: fixed depth)")
+    parser.add_argument("--engine1", nargs="*", metavar="NAME=VALUE",
+                        help="Searcher settings of the first engine, e.g. depth=4 ttSizeMB=8")
+    parser.add_argument("--engine2", nargs="*", metavar="NAME=VALUE", help="Searcher settings of the second engine")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Games played at once (default: one per core)")
+    parser.add_argument("--random-plies", type=int, default=RANDOM_PLIES,
+                        help="Random opening moves before the engines take over (default %d)" % RANDOM_PLIES)
+    parser.add_argument("--openings", help="FEN/EPD file of start positions, used instead of random openings")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES,
+                        help="Score unfinished games as draws after this many plies (default %d)" % MAX_PLIES)
+    parser.add_argument("--seed", type=int, help="Seed for the openings")
+    parser.add_argument("--pgn", help="Write the games to this PGN file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print every game as it finishes")
+    args = parser.parse_args(argv)
+    engine1 = parseEngineConfig(args.engine1)
+    engine2 = parseEngineConfig(args.engine2)
+    pgnFile = open(args.pgn, "w") if args.pgn else None
+
+    def report(gameNumber, game, engine1White):
+        if args.verbose:
+            print("Game %d: engine%d (White) vs engine%d: %s, %s in %d plies" %
+                  (gameNumber, 1 if engine1White else 2, 2 if engine1White else 1, game["result"], game["reason"],
+                   len(game["moves"])), flush=True)
+        if pgnFile is not None:
+            headers = {"Event": "Engine match", "Round": str(gameNumber), "Termination": game["reason"],
+                       "White": "engine1" if engine1White else "engine2",
+                       "Black": "engine2" if engine1White else "engine1"}
+            pgn.writeGame(pgnFile, game["moves"], headers, startFen=game["fen"], result=game["result"])
+
+    try:
+        summary = runMatch(args.games, engine1, engine2, timeLimit=args.time, workers=args.workers,
+                           randomPlies=args.random_plies, seed=args.seed, openingsFile=args.openings,
+                           maxPlies=args.max_plies, report=report)
+    finally:
+        if pgnFile is not None:
+            pgnFile.close()
+    print("engine1 %s vs engine2 %s" % (engine1 or "defaults", engine2 or "defaults"))
+    print("Games: %d  +%d =%d -%d  Score: %.1f%%" % (summary["games"], summary["wins"], summary["draws"],
+                                                      summary["losses"], 100 * summary["score"]))
+    print("Elo difference: %.1f +/- %.1f" % (summary["elo"], summary["eloError"]))
+    print("Nodes per second: engine1 %.0f, engine2 %.0f  (%.1fs)" % (summary["nps"][0], summary["nps"][1],
+                                                                    summary["elapsed"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+- perft: counts the leaf nodes of the legal move tree to a fixed depth, through makeMove/undoMove
+- Checks the move generators against published node counts and reports nodes per second
+- python -m Chess.perft                    runs the reference suite
+- python -m Chess.perft --fen "..." -d 3  counts one position, --divide splits the count per root move
+"""
+
+import argparse
+import sys
+import time
+
+from Chess import ChessEngine
+
+START_FEN = ChessEngine.START_FEN
+
+# (name, FEN, known node counts for depth 1, 2, 3...) from the Chess Programming Wiki perft pages
+# and Peter Ellis Jones' perft edge case collection (a None entry means that depth isn't listed there)
+REFERENCE_POSITIONS = [
+    ("Initial position", START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("Position 3 (en passant, pins)", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("Position 4 (promotions)", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("Position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("Position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890]),
+    ("Illegal en passant (pin)", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     [None, None, None, None, None, 1134888]),
+    ("Illegal en passant (discovered)", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+     [None, None, None, None, None, 1015133]),
+    ("En passant gives check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     [None, None, None, None, None, 1440467]),
+    ("Short castling gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+     [None, None, None, None, None, 661072]),
+    ("Long castling gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+     [None, None, None, None, None, 803711]),
+    ("Castling rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+     [None, None, None, 1274206]),
+    ("Castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+     [None, None, None, 1720476]),
+    ("Double check", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+     [None, None, None, 23527]),
+    ("Promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+     [None, None, None, None, None, 3821001]),
+    ("Discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+     [None, None, None, None, 1004658]),
+    ("Promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+     [None, None, None, None, None, 217342]),
+    ("Underpromote to check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     [None, None, None, None, None, 92683]),
+    ("Self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+     [None, None, None, None, None, 2217]),
+    ("Stalemate and checkmate", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+     [None, None, None, None, None, None, 567584]),
+]
+
+
+'''
+Number of leaf nodes depth plies down. The last ply is counted from the length of the legal move list
+(bulk counting) instead of making every leaf move
+'''
+def perft(gameState, depth):
+    if depth == 0:
+        return 1
+    moves = gameState.getValidMoves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gameState.makeMove(move)
+        nodes += perft(gameState, depth - 1)
+        gameState.undoMove()
+    return nodes
+
+
+'''
+perft split by root move, the usual way to find which move a generator gets wrong
+'''
+def divide(gameState, depth):
+    counts = []
+    for move in gameState.getValidMoves():
+        gameState.makeMove(move)
+        counts.append((move.getChessNotation(), perft(gameState, depth - 1)))
+        gameState.undoMove()
+    return counts
+
+
+def runPerft(fen, depth, useBitboards):
+    gameState = ChessEngine.GameState.fromFen(fen, useBitboards)
+    startTime = time.perf_counter()
+    nodes = perft(gameState, depth)
+    elapsed = time.perf_counter() - startTime
+    return nodes, elapsed
+
+
+'''
+Runs every reference position at every listed depth up to maxDepth, returns True if all counts match
+'''
+def runSuite(maxDepth, useBitboards, out=sys.stdout):
+    allPassed = True
+    totalNodes = 0
+    totalTime = 0
+    for name, fen, counts in REFERENCE_POSITIONS:
+        for depth, expected in enumerate(counts, 1):
+            if expected is None or depth > maxDepth:
+                continue
+            nodes, elapsed = runPerft(fen, depth, useBitboards)
+            totalNodes += nodes
+            totalTime += elapsed
+            passed = nodes == expected
+            allPassed = allPassed and passed
+            print("%-4s %-32s depth %d: %10d nodes (expected %10d) %8.2fs %9.0f nps" %
+                  ("ok" if passed else "FAIL", name, depth, nodes, expected, elapsed, nodes / max(elapsed, 1e-9)),
+                  file=out, flush=True)
+    print("%s: %d nodes in %.2fs, %.0f nodes per second" %
+          ("All passed" if allPassed else "FAILURES", totalNodes, totalTime, totalNodes / max(totalTime, 1e-9)),
+          file=out)
+    return allPassed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count move generator leaf nodes (perft)")
+    parser.add_argument("--fen", help="Position to count, runs the reference suite if omitted")
+    parser.add_argument("-d", "--depth", type=int, help="Depth (suite: deepest depth to run, default 4)")
+    parser.add_argument("--divide", action="store_true", help="Print the count for each root move")
+    parser.add_argument("--legacy", action="store_true", help="Use the board walking generator instead of bitboards")
+    args = parser.parse_args(argv)
+    useBitboards = not args.legacy
+
+    if args.fen is None:
+        return 0 if runSuite(args.depth or 4, useBitboards) else 1
+
+    depth = args.depth or 1
+    if args.divide:
+        gameState = ChessEngine.GameState.fromFen(args.fen, useBitboards)
+        total = 0
+        for notation, nodes in divide(gameState, depth):
+            print(notation + ":", nodes)
+            total += nodes
+        print("Nodes:", total)
+    else:
+        nodes, elapsed = runPerft(args.fen, depth, useBitboards)
+        print("Nodes: %d  Time: %.2fs  NPS: %.0f" % (nodes, elapsed, nodes / max(elapsed, 1e-9)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
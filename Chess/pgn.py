@@ -0,0 +1,332 @@
+"""
+- Reads and writes games in PGN (Portable Game Notation)
+- readGames streams games from a file one at a time, so files of any size can be read
+- getSan/formatGame write proper SAN: disambiguation, captures, promotions, check and mate
+"""
+
+import re
+
+from Chess import ChessEngine
+from Chess.ChessEngine import Move
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+LINE_LENGTH = 80 # PGN export format keeps movetext lines under this
+
+tagPattern = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+sanPattern = re.compile(r"^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?[+#]?[!?]*$")
+moveNumberPattern = re.compile(r"^\d+\.+")
+knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+kingMoves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+rookDirections = ((-1, 0), (0, -1), (1, 0), (0, 1))
+bishopDirections = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+class PgnGame:
+    def __init__(self, headers=None, moves=None, result="*"):
+        self.headers = headers if headers is not None else {} # Tag name -> value, in file order
+        self.moves = moves if moves is not None else [] # SAN strings, main line only
+        self.result = result
+
+    '''
+    Position the game starts from: the FEN tag if there is one, otherwise the normal start
+    '''
+    def getStartFen(self):
+        return self.headers.get("FEN", ChessEngine.START_FEN)
+
+    '''
+    Plays the game out and returns the final GameState, its moveLog holds every move
+    '''
+    def replay(self, useBitboards=True):
+        gameState = ChessEngine.GameState.fromFen(self.getStartFen(), useBitboards=useBitboards)
+        for san in self.moves:
+            gameState.makeMove(parseSan(gameState, san))
+        return gameState
+
+
+'''
+Generator of PgnGame, one per game in lines (any iterable of text lines, e.g. an open file).
+Only the game being read is held in memory. Comments, variations and NAGs are skipped
+'''
+def readGames(lines):
+    headers = {}
+    moves = []
+    result = None
+    commentDepth = 0 # Inside {...}
+    variationDepth = 0 # Inside (...)
+    inGame = False
+    for line in lines:
+        if commentDepth == 0 and line.startswith("%"): # Escape line
+            continue
+        if commentDepth == 0 and variationDepth == 0 and line.lstrip().startswith("["):
+            if inGame and moves or result is not None: # Tags after movetext start the next game
+                yield PgnGame(headers, moves, result or headers.get("Result", "*"))
+                headers, moves, result = {}, [], None
+            for match in tagPattern.finditer(line):
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+            inGame = True
+            continue
+        line = stripLineComment(line, commentDepth > 0)
+        # Split out braces and parentheses so they're tokens even when written against a move: "e4{good}"
+        for token in line.replace("{", " { ").replace("}", " } ").replace("(", " ( ").replace(")", " ) ").split():
+            if commentDepth:
+                if token == "}":
+                    commentDepth = 0
+                continue
+            if token == "{":
+                commentDepth = 1
+            elif token == "(":
+                variationDepth += 1
+            elif token == ")":
+                variationDepth = max(0, variationDepth - 1)
+            elif variationDepth or token.startswith("$"):
+                continue
+            elif token in RESULTS:
+                result = token
+                inGame = True
+            else:
+                token = moveNumberPattern.sub("", token).rstrip("!?") # "12.e4" and "12..." as well as "12.", no "!?"
+                if token:
+                    moves.append(token)
+                    inGame = True
+    if inGame:
+        yield PgnGame(headers, moves, result or headers.get("Result", "*"))
+
+
+'''
+line up to its first ";" outside a {...} comment: the rest of the line is a comment, even straight after a move
+("a6; rest of line"). inComment is whether the line starts inside a {...} comment from an earlier line
+'''
+def stripLineComment(line, inComment):
+    for i, char in enumerate(line):
+        if char == "{":
+            inComment = True
+        elif char == "}":
+            inComment = False
+        elif char == ";" and not inComment:
+            return line[:i]
+    return line
+
+
+'''
+The Move a SAN string stands for in gameState. Works the move out from the board around its destination
+instead of generating every legal move; only an ambiguous SAN (two pieces could go there) falls back to the
+legal move list to see which one is allowed. Raises ValueError if no legal move matches
+'''
+def parseSan(gameState, san):
+    board = gameState.board
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        row, col = gameState.whiteKingLocation if gameState.whiteToMove else gameState.blackKingLocation
+        endCol = col + 2 if text in ("O-O", "0-0") else col - 2
+        for move in gameState.getValidMoves(): # Rights, empty squares and attacked squares all matter, ask the generator
+            if move.isCastleMove and (move.startRow, move.startCol, move.endCol) == (row, col, endCol):
+                return move
+        raise ValueError("Illegal SAN move " + san + " in " + gameState.toFen())
+    match = sanPattern.match(text)
+    if match is None:
+        raise ValueError("Can't read SAN move: " + san)
+    pieceType, fromFile, fromRank, capture, target, promotion = match.groups()
+    pieceType = pieceType or "P"
+    color = "w" if gameState.whiteToMove else "b"
+    endRow = Move.ranksToRows[target[1]]
+    endCol = Move.filesToCols[target[0]]
+    fromCol = Move.filesToCols[fromFile] if fromFile else None
+    fromRow = Move.ranksToRows[fromRank] if fromRank else None
+    # What's on the target has to fit the SAN: empty for a move, an enemy piece for a capture (or the en passant square)
+    targetPiece = board[endRow][endCol]
+    if capture:
+        passedRow = endRow + (1 if color == "w" else -1) # Where a pawn taken en passant stands
+        legalTarget = targetPiece[0] not in ("-", color) or \
+            pieceType == "P" and (endRow, endCol) == gameState.enPassantPossible and 0 <= passedRow < 8 and \
+            board[passedRow][endCol] == ("b" if color == "w" else "w") + "P"
+    else:
+        legalTarget = targetPiece == "--"
+    if not legalTarget:
+        raise ValueError("Illegal SAN move " + san + " in " + gameState.toFen())
+
+    candidates = [(row, col) for row, col in findOrigins(board, color + pieceType, endRow, endCol, capture is not None)
+                  if (fromRow is None or row == fromRow) and (fromCol is None or col == fromCol)]
+    if len(candidates) == 1:
+        row, col = candidates[0]
+        enPassant = pieceType == "P" and col != endCol and targetPiece == "--"
+        move = Move((row, col), (endRow, endCol), board, enPassant=enPassant, promotionChoice=promotion or "Q")
+        if leavesKingInCheck(gameState, move): # Pinned, or doesn't answer a check
+            raise ValueError("Illegal SAN move " + san + " in " + gameState.toFen())
+        return move
+    # Ambiguous on the board (one of them must be pinned) or nothing found: let the legal moves decide
+    for move in gameState.getValidMoves():
+        if move.pieceMoved == color + pieceType and (move.endRow, move.endCol) == (endRow, endCol) and \
+                (move.startRow, move.startCol) in candidates and \
+                (not move.pawnPromotion or move.promotionChoice == (promotion or "Q")):
+            return move
+    raise ValueError("Illegal SAN move " + san + " in " + gameState.toFen())
+
+
+'''
+Whether playing move would leave the mover's own King attacked
+'''
+def leavesKingInCheck(gameState, move):
+    gameState.makeMove(move)
+    gameState.whiteToMove = not gameState.whiteToMove # Ask about the side that just moved
+    row, col = gameState.whiteKingLocation if gameState.whiteToMove else gameState.blackKingLocation
+    inCheck = gameState.squareUnderAttack(row, col)
+    gameState.whiteToMove = not gameState.whiteToMove
+    gameState.undoMove()
+    return inCheck
+
+
+'''
+Squares holding piece that could move to (endRow, endCol), looking outwards from the destination.
+Pins and checks aren't considered
+'''
+def findOrigins(board, piece, endRow, endCol, isCapture):
+    origins = []
+    pieceType = piece[1]
+    if pieceType == "P":
+        moveAmount = -1 if piece[0] == "w" else 1
+        startRow = 6 if piece[0] == "w" else 1
+        row = endRow - moveAmount
+        if not 0 <= row < 8:
+            return origins
+        if isCapture:
+            for col in (endCol - 1, endCol + 1):
+                if 0 <= col < 8 and board[row][col] == piece:
+                    origins.append((row, col))
+        elif board[row][endCol] == piece:
+            origins.append((row, endCol))
+        elif board[row][endCol] == "--" and row - moveAmount == startRow and board[startRow][endCol] == piece:
+            origins.append((startRow, endCol))
+    elif pieceType == "N" or pieceType == "K":
+        for m in (knightMoves if pieceType == "N" else kingMoves):
+            row = endRow + m[0]
+            col = endCol + m[1]
+            if 0 <= row < 8 and 0 <= col < 8 and board[row][col] == piece:
+                origins.append((row, col))
+    else:
+        directions = rookDirections if pieceType == "R" else bishopDirections if pieceType == "B" else kingMoves
+        for d in directions:
+            row = endRow + d[0]
+            col = endCol + d[1]
+            while 0 <= row < 8 and 0 <= col < 8:
+                if board[row][col] != "--":
+                    if board[row][col] == piece:
+                        origins.append((row, col))
+                    break
+                row += d[0]
+                col += d[1]
+    return origins
+
+
+'''
+SAN for a legal move in gameState, e.g. Nbd7, exd5, e8=Q+, O-O#. validMoves are gameState's legal moves
+(generated if not given), used to tell apart pieces of the same kind that can reach the same square
+'''
+def getSan(gameState, move, validMoves=None):
+    if move.isCastleMove:
+        san = "O-O" if move.endCol > move.startCol else "O-O-O"
+    else:
+        target = move.getRankFile(move.endRow, move.endCol)
+        pieceType = move.pieceMoved[1]
+        if pieceType == "P":
+            san = (move.colsToFiles[move.startCol] + "x" if move.isCapture else "") + target
+            if move.pawnPromotion:
+                san += "=" + move.promotionChoice
+        else:
+            if validMoves is None:
+                validMoves = gameState.getValidMoves()
+            rivals = [other for other in validMoves if other.pieceMoved == move.pieceMoved and
+                      other.endRow == move.endRow and other.endCol == move.endCol and
+                      (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+            disambiguation = ""
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    disambiguation = move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    disambiguation = move.rowsToRanks[move.startRow]
+                else:
+                    disambiguation = move.getRankFile(move.startRow, move.startCol)
+            san = pieceType + disambiguation + ("x" if move.isCapture else "") + target
+    # Check or mate
+    gameState.makeMove(move)
+    replies = gameState.getValidMoves()
+    if gameState.inCheck:
+        san += "#" if not replies else "+"
+    gameState.undoMove()
+    return san
+
+
+'''
+SAN for each move of moves, played from startFen
+'''
+def getSanMoves(moves, startFen=ChessEngine.START_FEN, useBitboards=True):
+    gameState = ChessEngine.GameState.fromFen(startFen, useBitboards=useBitboards)
+    sanMoves = []
+    for move in moves:
+        validMoves = gameState.getValidMoves()
+        for legalMove in validMoves: # Use the generator's own move, so flags match this position
+            if legalMove == move:
+                break
+        else:
+            raise ValueError("Illegal move " + move.getChessNotation() + " in " + gameState.toFen())
+        sanMoves.append(getSan(gameState, legalMove, validMoves))
+        gameState.makeMove(legalMove)
+    return sanMoves
+
+
+'''
+A whole game as PGN text: the seven tag roster (filled with "?" where not given), any other headers, then the
+movetext wrapped to LINE_LENGTH. moves are Move objects, e.g. a GameState's moveLog
+'''
+def formatGame(moves, headers=None, startFen=ChessEngine.START_FEN, result=None):
+    headers = dict(headers or {})
+    if result is None:
+        result = headers.get("Result", "*")
+    headers["Result"] = result
+    if startFen != ChessEngine.START_FEN:
+        headers["SetUp"] = "1"
+        headers["FEN"] = startFen
+    lines = []
+    for name in SEVEN_TAG_ROSTER:
+        lines.append('[%s "%s"]' % (name, escapeTag(headers.get(name, "?"))))
+    for name, value in headers.items():
+        if name not in SEVEN_TAG_ROSTER:
+            lines.append('[%s "%s"]' % (name, escapeTag(value)))
+    lines.append("")
+
+    fields = startFen.split()
+    whiteToMove = len(fields) < 2 or fields[1] == "w"
+    moveNumber = int(fields[5]) if len(fields) > 5 else 1
+    tokens = []
+    for i, san in enumerate(getSanMoves(moves, startFen)):
+        if whiteToMove:
+            tokens.append(str(moveNumber) + ".")
+        elif i == 0: # Game starts with Black to move
+            tokens.append(str(moveNumber) + "...")
+        tokens.append(san)
+        if not whiteToMove:
+            moveNumber += 1
+        whiteToMove = not whiteToMove
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def escapeTag(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+'''
+Appends a game to out (an open text file), with the blank line PGN puts between games
+'''
+def writeGame(out, moves, headers=None, startFen=ChessEngine.START_FEN, result=None):
+    out.write(formatGame(moves, headers, startFen, result))
+    out.write("\n")
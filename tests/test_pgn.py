@@ -0,0 +1,81 @@
+import io
+import unittest
+
+from Chess import ChessEngine, pgn
+
+
+class ParseSanTest(unittest.TestCase):
+    def parse(self, fen, san, useBitboards=True):
+        gameState = ChessEngine.GameState.fromFen(fen, useBitboards=useBitboards)
+        return pgn.parseSan(gameState, san).getChessNotation()
+
+    def testLegalMoves(self):
+        for useBitboards in (True, False):
+            self.assertEqual(self.parse(ChessEngine.START_FEN, "Nf3", useBitboards), "g1f3")
+            self.assertEqual(self.parse(ChessEngine.START_FEN, "e4", useBitboards), "e2e4")
+            self.assertEqual(self.parse("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2", "exd6", useBitboards), "e5d6")
+            self.assertEqual(self.parse("4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1", "O-O-O", useBitboards), "e1c1")
+            self.assertEqual(self.parse("4k3/8/8/8/8/8/4K3/R6R w - - 0 1", "Rad1", useBitboards), "a1d1")
+            self.assertEqual(self.parse("4k3/1P6/8/8/8/8/8/4K3 w - - 0 1", "b8=N", useBitboards), "b7b8n")
+
+    '''
+    Moves that no legal move matches must raise ValueError and leave the position alone
+    '''
+    def testIllegalMoves(self):
+        illegal = [(ChessEngine.START_FEN, "Nd2"), # Own pawn on the target
+                   (ChessEngine.START_FEN, "Ke2"),
+                   (ChessEngine.START_FEN, "Nxf3"), # Capture of an empty square
+                   ("4k3/8/8/3pP3/8/8/8/4K3 w - - 0 2", "exd6"), # No en passant right
+                   ("4k3/8/8/4P3/8/8/8/4K3 w - d6 0 2", "exd6"), # No pawn to take
+                   ("4k3/8/4n3/4P3/8/8/8/4K3 w - - 0 1", "e6"), # Pawn push onto a piece
+                   ("4k3/4r3/8/8/8/8/4N3/4K3 w - - 0 1", "Nf4"), # Pinned
+                   ("4k3/8/8/8/8/8/8/R3K2R w - - 0 1", "O-O"), # No castling rights
+                   (ChessEngine.START_FEN, "Qh5")]
+        for useBitboards in (True, False):
+            for fen, san in illegal:
+                gameState = ChessEngine.GameState.fromFen(fen, useBitboards=useBitboards)
+                with self.assertRaises(ValueError, msg=san + " in " + fen):
+                    pgn.parseSan(gameState, san)
+                self.assertEqual(gameState.toFen(), fen)
+
+
+class ReadGamesTest(unittest.TestCase):
+    def testCommentsAndVariations(self):
+        text = ('[Event "One"]\n[Result "1-0"]\n\n1. e4 a6; rest of line\n2. Nf3 {a ; in a comment} Nc6 {over\n'
+                'two lines; still a comment} 3. Bb5 (3. Bc4 Bc5) $1 Nf6 1-0\n\n'
+                '[Event "Two"]\n\n1. d4 d5 *\n')
+        games = list(pgn.readGames(io.StringIO(text)))
+        self.assertEqual(len(games), 2)
+        self.assertEqual(games[0].headers["Event"], "One")
+        self.assertEqual(games[0].moves, ["e4", "a6", "Nf3", "Nc6", "Bb5", "Nf6"])
+        self.assertEqual(games[0].result, "1-0")
+        self.assertEqual(games[1].moves, ["d4", "d5"])
+        self.assertEqual(games[1].result, "*")
+        games[0].replay()
+
+
+class GetSanTest(unittest.TestCase):
+    def san(self, fen, notation):
+        gameState = ChessEngine.GameState.fromFen(fen, useBitboards=True)
+        validMoves = gameState.getValidMoves()
+        move = next(move for move in validMoves if move.getChessNotation() == notation)
+        return pgn.getSan(gameState, move, validMoves)
+
+    def testSan(self):
+        self.assertEqual(self.san(ChessEngine.START_FEN, "g1f3"), "Nf3")
+        self.assertEqual(self.san("4k3/8/8/8/8/8/4K3/R6R w - - 0 1", "a1d1"), "Rad1")
+        self.assertEqual(self.san("4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1", "e1g1"), "O-O")
+        self.assertEqual(self.san("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2", "e5d6"), "exd6")
+        self.assertEqual(self.san("6k1/5ppp/8/8/8/8/8/R3K3 w - - 0 1", "a1a8"), "Ra8#")
+        self.assertEqual(self.san("4k3/8/8/8/8/8/8/R3K3 w - - 0 1", "a1a8"), "Ra8+")
+
+    def testRoundTrip(self):
+        gameState = ChessEngine.GameState.fromFen(ChessEngine.START_FEN, useBitboards=True)
+        for san in ("e4", "e5", "Nf3", "Nc6", "Bb5", "a6", "Bxc6", "dxc6", "O-O"):
+            move = pgn.parseSan(gameState, san)
+            self.assertEqual(pgn.getSan(gameState, move), san)
+            gameState.makeMove(move)
+
+
+if __name__ == "__main__":
+    unittest.main()
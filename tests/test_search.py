@@ -0,0 +1,31 @@
+import random
+import unittest
+
+from Chess import ChessAI, ChessEngine
+
+PRUNING_OFF = dict(nullMove=False, lmr=False, futility=False, razoring=False)
+
+
+class ParallelSearchTest(unittest.TestCase):
+    '''
+    The pool processes have to search with the parent's settings, or workers > 1 plays a different engine
+    '''
+    def testParallelMatchesSingleProcess(self):
+        for seed in range(3): # Seeds the root move shuffle
+            scores = []
+            for workers in (1, 3):
+                random.seed(seed)
+                gameState = ChessEngine.GameState(useBitboards=True)
+                searcher = ChessAI.Searcher(depth=4, workers=workers, **PRUNING_OFF)
+                try:
+                    move = searcher.findBestMove(gameState, gameState.getValidMoves())
+                finally:
+                    searcher.close()
+                self.assertIsNotNone(move)
+                self.assertEqual(searcher.completedDepth, 4)
+                scores.append(searcher.score)
+            self.assertAlmostEqual(scores[0], scores[1], msg="seed %d" % seed)
+
+
+if __name__ == "__main__":
+    unittest.main()